@@ -4,10 +4,29 @@ from flask import Flask
 
 from environ import Environ
 from phant import wrap_flask_app
+from phant.asgi import AsgiAdapter
+from phant.inbox import SqliteInbox
+from phant.key_registry import SqliteKeyRegistry
+from phant.logs import JsonFormatter
+from phant.profiling import profiler
+from phant.server import access_log
 
 logging.basicConfig(level=logging.INFO)
+access_log.sample_rate = Environ.LOG_SAMPLE_RATE
+access_handler = logging.StreamHandler()
+access_handler.setFormatter(JsonFormatter() if Environ.LOG_JSON else logging.Formatter(logging.BASIC_FORMAT))
+access_log.start(access_handler)
+profiler.enabled = Environ.PROFILE
+profiler.profile_dir = Environ.PROFILE_DIR
 app = Flask(__name__)
-wrap_flask_app(Environ.INSTANCE, app)
+wrap_flask_app(
+    Environ.INSTANCE,
+    app,
+    inbox=SqliteInbox(Environ.INBOX_PATH) if Environ.INBOX_PATH else None,
+    key_registry=SqliteKeyRegistry(Environ.KEYS_PATH) if Environ.KEYS_PATH else None,
+)
+# Served by an ASGI server, e.g. `uvicorn app:asgi_app`
+asgi_app = AsgiAdapter(app)
 
 
 if __name__ == "__main__":
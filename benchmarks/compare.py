@@ -0,0 +1,25 @@
+import argparse
+import json
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two JSON benchmark reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    with open(args.before) as fp:
+        before = json.load(fp)
+    with open(args.after) as fp:
+        after = json.load(fp)
+    for name, metrics in after["results"].items():
+        for metric, value in metrics.items():
+            old = before["results"].get(name, {}).get(metric)
+            if isinstance(old, (int, float)) and old != 0:
+                change = f"{(value - old) / old * 100:+.1f}%"
+            else:
+                change = "new"
+            print(f"{name} {metric}: {old} -> {value} ({change})")
+
+
+if __name__ == "__main__":
+    main()
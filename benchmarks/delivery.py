@@ -0,0 +1,129 @@
+import asyncio
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import phant.delivery
+from phant.actor import Actor
+from phant.instance import Instance
+from phant.keys import generate_keys
+from report import Report, arguments
+
+SIZES = (1, 100, 1000)
+# Nothing listens there, so deliveries to it fail with a connection error
+UNREACHABLE = "http://127.0.0.1:1"
+
+
+class StandIn:
+    # A remote instance that accepts every inbox POST, except for the inboxes told to fail with a status
+    def __init__(self):
+        self.posts = Counter()
+        self.statuses: dict[str, int] = {}
+        self.port = None
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/{path:.*}", self._post)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _post(self, request: web.Request) -> web.Response:
+        await request.read()
+        self.posts[request.path] += 1
+        return web.Response(status=self.statuses.get(request.path, 202))
+
+
+def recipient(instance: str, username: str, inbox: str = None) -> Actor:
+    actor_url = f"{instance}/users/{username}"
+    return Actor(username, Instance(instance), None, id=actor_url, inbox=inbox or f"{actor_url}/inbox")
+
+
+async def check(sender: Actor, stand_in: StandIn):
+    # Pins down what post_note_many promises: one result per recipient in order, one POST and one signature per
+    # distinct inbox, and failures reported on the recipients they belong to
+    instance = f"http://127.0.0.1:{stand_in.port}"
+    shared = f"{instance}/inbox"
+    stand_in.statuses["/users/busy/inbox"] = 503
+    recipients = [
+        recipient(instance, "alice", shared),
+        recipient(instance, "bob", shared),
+        recipient(instance, "carol"),
+        recipient(instance, "carol"),
+        recipient(instance, "busy"),
+        recipient(UNREACHABLE, "ghost"),
+        recipient(instance, "dave", shared),
+    ]
+    stand_in.posts.clear()
+    signatures = Counter()
+    signed_headers = phant.delivery.signed_headers
+
+    def counting(method, endpoint, *args, **kwargs):
+        signatures[endpoint] += 1
+        return signed_headers(method, endpoint, *args, **kwargs)
+
+    phant.delivery.signed_headers = counting
+    try:
+        results = await phant.delivery.post_note_many("check", sender, recipients)
+    finally:
+        phant.delivery.signed_headers = signed_headers
+    assert [result.recipient for result in results] == recipients
+    assert [result.status for result in results] == [202, 202, 202, 202, 503, None, 202]
+    assert [result.ok for result in results] == [True, True, True, True, False, False, True]
+    assert results[5].error is not None
+    assert stand_in.posts == {"/inbox": 1, "/users/carol/inbox": 1, "/users/busy/inbox": 1}
+    assert signatures == {shared: 1, f"{instance}/users/carol/inbox": 1, f"{instance}/users/busy/inbox": 1,
+                          f"{UNREACHABLE}/users/ghost/inbox": 1}
+
+
+async def deliver(sender: Actor, recipients: list[Actor]) -> float:
+    start = time.perf_counter()
+    results = await phant.delivery.post_note_many("benchmark", sender, recipients)
+    elapsed = time.perf_counter() - start
+    assert all(result.ok for result in results)
+    return len(recipients) / elapsed
+
+
+async def run(report: Report, sender: Actor):
+    stand_in = StandIn()
+    await stand_in.start()
+    try:
+        await check(sender, stand_in)
+        instance = f"http://127.0.0.1:{stand_in.port}"
+        for size in SIZES:
+            report.add(
+                f"{size}_recipients",
+                personal_inboxes_per_s=await deliver(
+                    sender, [recipient(instance, f"user{index}") for index in range(size)]
+                ),
+                shared_inbox_per_s=await deliver(
+                    sender, [recipient(instance, f"user{index}", f"{instance}/inbox") for index in range(size)]
+                ),
+            )
+    finally:
+        await stand_in.stop()
+
+
+def main():
+    report = Report("delivery", arguments().json)
+    with tempfile.TemporaryDirectory() as directory:
+        generate_keys(f"{directory}/sender.pem", f"{directory}/sender.pub")
+        sender = Actor.phant("sender", "https://example.com", f"{directory}/sender.pem", f"{directory}/sender.pub")
+        asyncio.run(run(report, sender))
+    report.write()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import inspect
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+from flask import Flask, request
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from phant.server import endpoint, endpoints, logger
+from report import Report, arguments
+
+CALLS = 100_000
+logger.setLevel(logging.WARNING)
+
+
+def inbox_get(user: str, encoding: str = "array", wait: str = "0"):
+    return ""
+
+
+def robots():
+    return ""
+
+
+def log(message: str):
+    logger.info(f"{request.method} {request.path} {dict(request.values)} - {message}")
+
+
+def legacy_endpoint(callback):
+    # The per-request validation and logging used before validators were compiled at decoration time
+    def wrapper(**kwargs):
+        kwargs = dict(request.values, **kwargs)
+        for name, param in parameters.items():
+            if name not in kwargs and param.default is param.empty:
+                log(f"Missing parameter '{name}'.")
+                return f"Missing parameter '{name}'.", 422
+            elif name in kwargs and not isinstance(kwargs[name], param.annotation):
+                log(f"Parameter '{name}' should be of type {param.annotation}.")
+                return f"Parameter '{name}' should be of type {param.annotation}.", 422
+        response = callback(**kwargs)
+        if response is None:
+            response = ""
+        elif isinstance(response, bool):
+            response = json.dumps(response)
+        log("OK")
+        return response
+
+    parameters = inspect.signature(callback).parameters
+    return wrapper
+
+
+def compiled_endpoint(callback):
+    endpoint(f"/benchmark/{callback.__name__}")(callback)
+    return endpoints[-1][2]
+
+
+def measure(wrapper, path: str, **kwargs):
+    with Flask(__name__).test_request_context(path):
+        start = time.perf_counter()
+        for _ in range(CALLS):
+            wrapper(**kwargs)
+        return (time.perf_counter() - start) / CALLS * 1e6
+
+
+def main():
+    report = Report("endpoint", arguments().json)
+    for callback, path, kwargs in (
+            (inbox_get, "/users/bob/inbox?encoding=base64", {"user": "bob"}),
+            (robots, "/robots.txt", {}),
+    ):
+        before = measure(legacy_endpoint(callback), path, **kwargs)
+        after = measure(compiled_endpoint(callback), path, **kwargs)
+        report.add(callback.__name__, legacy_us=before, compiled_us=after)
+    report.write()
+
+
+if __name__ == "__main__":
+    main()
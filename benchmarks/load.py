@@ -0,0 +1,135 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from phant import register, post_note, wait_inbox
+from phant.client import get_inbox
+from phant.keys import DEFAULT_KEY_BITS, RSA_KEY, generate_keys_many
+from report import Report, arguments, percentile
+
+
+def start_server(port: int, asgi: bool, inbox_path: str = None) -> subprocess.Popen:
+    if asgi:
+        command = [sys.executable, "-m", "uvicorn", "app:asgi_app", "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"]
+    environment = dict(os.environ, INSTANCE_URL=f"127.0.0.1:{port}", LOG_SAMPLE_RATE="0")
+    if inbox_path is not None:
+        environment["INBOX_PATH"] = inbox_path
+    server = subprocess.Popen(
+        command, cwd=ROOT, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/robots.txt", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise TimeoutError("The server did not start")
+
+
+def rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as fp:
+            for line in fp:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def drive(report: Report, name: str, executor: ThreadPoolExecutor, workloads: list[list[Callable]]):
+    # Each workload runs sequentially on its own thread
+    def run(operations: list[Callable]) -> list[float]:
+        latencies = []
+        for operation in operations:
+            start = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    latencies = [latency for result in executor.map(run, workloads) for latency in result]
+    elapsed = time.perf_counter() - start
+    report.add(
+        name,
+        requests=len(latencies),
+        per_s=len(latencies) / elapsed,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a local phant server started from app.py")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per phase")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--bits", type=int, default=DEFAULT_KEY_BITS)
+    parser.add_argument("--key-type", default=RSA_KEY)
+    parser.add_argument("--inbox-path", help="use a SqliteInbox at this path")
+    parser.add_argument("--asgi", action="store_true", help="serve app:asgi_app with uvicorn")
+    args = arguments(parser)
+    report = Report("load", args.json)
+    instance = f"127.0.0.1:{args.port}"
+    directory = tempfile.mkdtemp()
+    key_paths = generate_keys_many(2 * args.concurrency, directory, args.bits, key_type=args.key_type)
+    server = start_server(args.port, args.asgi, args.inbox_path)
+    try:
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            actors = {}
+            drive(report, "register", executor, [
+                [lambda index=index, paths=paths: actors.__setitem__(index, register(
+                    f"user{index}", instance, public_key_path=str(paths[1]), private_key_path=str(paths[0])
+                ))]
+                for index, paths in enumerate(key_paths)
+            ])
+            # Worker i always sends as user 2i to user 2i + 1, so workers never drain each other's inboxes
+            pairs = [(actors[2 * worker], actors[2 * worker + 1]) for worker in range(args.concurrency)]
+            per_worker = max(1, args.requests // args.concurrency)
+
+            def post(sender, recipient):
+                post_note("phant load test", sender, recipient)
+
+            def post_and_wait(sender, recipient):
+                post_note("phant load test", sender, recipient)
+                wait_inbox(recipient, timeout=30)
+
+            drive(report, "post_note", executor, [
+                [lambda sender=sender, recipient=recipient: post(sender, recipient)] * per_worker
+                for sender, recipient in pairs
+            ])
+            drive(report, "get_inbox", executor, [
+                [lambda recipient=recipient: get_inbox(recipient)] for _, recipient in pairs
+            ])
+            drive(report, "post_note_wait_inbox", executor, [
+                [lambda sender=sender, recipient=recipient: post_and_wait(sender, recipient)] * per_worker
+                for sender, recipient in pairs
+            ])
+        report.add(
+            "memory",
+            server_rss_bytes=rss_bytes(server.pid),
+            client_max_rss_bytes=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        )
+    finally:
+        server.terminate()
+        server.wait()
+    report.write()
+
+
+if __name__ == "__main__":
+    main()
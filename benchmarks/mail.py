@@ -0,0 +1,73 @@
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from phant.datatypes import Mail
+from report import Report, arguments
+
+MAILS = 1000
+ACTIVITY = json.dumps({
+    "type": "Create",
+    "to": ["https://example.com/users/bob"],
+    "object": {"type": "Note", "content": "phant " * 340},
+}).encode()
+HEADERS = {
+    "Host": "example.com",
+    "Date": "Sat, 18 Oct 2026 10:00:00 GMT",
+    "Digest": "sha-256=" + "A" * 44,
+    "Signature": f'keyId="https://example.com/users/alice",headers="(request-target) digest host date",'
+                 f'signature="{"A" * 512}"',
+}
+
+
+def new_mail():
+    return Mail(
+        headers=dict(HEADERS),
+        method="POST",
+        path="/users/bob/inbox",
+        content_type="application/activity+json",
+        data=bytearray(ACTIVITY),
+    )
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    inbox = [build() for _ in range(MAILS)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del inbox
+    return (after - before) / MAILS
+
+
+def measure_throughput(encoding: str):
+    inbox = [new_mail() for _ in range(MAILS)]
+    start = time.perf_counter()
+    payload = json.dumps([mail.to_dict(encoding) for mail in inbox])
+    encoded = time.perf_counter() - start
+    start = time.perf_counter()
+    _ = [Mail(**item) for item in json.loads(payload)]
+    decoded = time.perf_counter() - start
+    return len(payload) / MAILS, MAILS / encoded, MAILS / decoded
+
+
+def main():
+    report = Report("mail", arguments().json)
+    report.add("activity", bytes=len(ACTIVITY), mails=MAILS)
+    report.add(
+        "heap_per_queued_mail",
+        to_dict_bytes=measure_memory(lambda: new_mail().to_dict()),
+        mail_bytes=measure_memory(new_mail),
+    )
+    for encoding in Mail.encodings:
+        size, encode_rate, decode_rate = measure_throughput(encoding)
+        report.add(encoding, wire_bytes_per_mail=size, encoded_per_s=encode_rate, decoded_per_s=decode_rate)
+    report.write()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import json
+import sys
+import time
+from pathlib import Path
+
+from Crypto.PublicKey import RSA
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from phant.actor import Actor
+from phant.auth import RequestsVerifier, signed_request
+from phant.datatypes import Mail
+from phant.instance import Instance
+from phant.keys import export_key_pem
+from report import Report, arguments
+
+DURATION = 1.0
+ACTIVITY = json.dumps({
+    "type": "Create",
+    "to": ["https://example.com/users/bob"],
+    "object": {"type": "Note", "content": "phant " * 100},
+})
+
+
+class CapturingTransport:
+    # Stands in for the network so only signing is measured
+    def __init__(self):
+        self.headers = None
+
+    def request(self, method: str, url: str, data: str = None, headers: dict[str, str] = None, **kwargs):
+        self.headers = headers
+        return _Response
+
+
+class _Response:
+    status_code = 202
+
+
+def measure(operation) -> tuple[float, float]:
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        operation()
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count / elapsed, elapsed / count * 1e6
+
+
+def add(report: Report, name: str, operation):
+    per_s, us = measure(operation)
+    report.add(name, ops_per_s=per_s, us_per_op=us)
+
+
+def main():
+    report = Report("micro", arguments().json)
+    key = RSA.generate(3072)
+    sender = Actor(
+        "alice",
+        Instance("https://example.com"),
+        id="https://example.com/users/alice",
+        publicKey={"id": "https://example.com/users/alice", "publicKeyPem": export_key_pem(key.public_key())},
+    )
+    sender.private_key = key
+    transport = CapturingTransport()
+    endpoint = "https://example.com/users/bob/inbox"
+    add(report, "signed_request", lambda: signed_request("POST", endpoint, sender, ACTIVITY, transport=transport))
+
+    mail = Mail(transport.headers, "POST", "/users/bob/inbox", "application/activity+json", ACTIVITY.encode())
+    instance = Instance("https://example.com")
+    verifier = RequestsVerifier()
+    verifier.set_key(sender.public_key_id, sender.public_key)
+    assert verifier.verify(instance, mail) is None
+    add(report, "verify", lambda: verifier.verify(instance, mail))
+    cached_verifier = RequestsVerifier(cache_size=16)
+    cached_verifier.set_key(sender.public_key_id, sender.public_key)
+    add(report, "verify_cached", lambda: cached_verifier.verify(instance, mail))
+
+    add(report, "instance_init", lambda: Instance("https://example.com/users/bob/inbox"))
+    for encoding in Mail.encodings:
+        add(report, f"mail_to_dict_{encoding}", lambda: mail.to_dict(encoding))
+    report.write()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import json
+import platform
+import time
+
+
+class Report:
+    # Prints results as they come and optionally writes them as JSON, so runs can be compared with compare.py
+    def __init__(self, benchmark: str, json_path: str = None):
+        self.benchmark = benchmark
+        self.json_path = json_path
+        self.results: dict[str, dict[str, float]] = {}
+
+    def add(self, name: str, **metrics: float):
+        self.results[name] = metrics
+        print(f"{name}: " + ", ".join(f"{metric} {_format(value)}" for metric, value in metrics.items()))
+
+    def write(self):
+        if self.json_path is None:
+            return
+        with open(self.json_path, "w") as fp:
+            json.dump({
+                "benchmark": self.benchmark,
+                "time": time.time(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": self.results,
+            }, fp, indent=2)
+
+
+def arguments(parser: argparse.ArgumentParser = None) -> argparse.Namespace:
+    parser = parser or argparse.ArgumentParser()
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    return parser.parse_args()
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def _format(value) -> str:
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
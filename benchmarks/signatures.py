@@ -0,0 +1,45 @@
+import sys
+import time
+from pathlib import Path
+
+from Crypto.PublicKey import ECC, RSA
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from phant.auth import _do_sign, _do_verify
+from report import Report, arguments
+
+DURATION = 2.0
+SIGNED_STRING = "(request-target): post /users/bob/inbox\n" \
+                "digest: sha-256=47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=\n" \
+                "host: example.com\n" \
+                "date: Sat, 18 Oct 2026 10:00:00 GMT"
+
+
+def throughput(operation) -> float:
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        operation()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    report = Report("signatures", arguments().json)
+    for name, key in (
+            ("rsa_sha256_3072", RSA.generate(3072)),
+            ("rsa_sha256_2048", RSA.generate(2048)),
+            ("hs2019_ed25519", ECC.generate(curve="ed25519")),
+    ):
+        signature = _do_sign(SIGNED_STRING, key)
+        public_key = key.public_key()
+        assert _do_verify(SIGNED_STRING, signature, public_key)
+        sign = throughput(lambda: _do_sign(SIGNED_STRING, key))
+        verify = throughput(lambda: _do_verify(SIGNED_STRING, signature, public_key))
+        report.add(name, sign_per_s=sign, verify_per_s=verify)
+    report.write()
+
+
+if __name__ == "__main__":
+    main()
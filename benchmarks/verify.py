@@ -0,0 +1,74 @@
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from Crypto.PublicKey import RSA
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from phant.auth import RequestsVerifier, _do_digest, _do_sign
+from phant.datatypes import Mail
+from phant.instance import Instance
+from report import Report, arguments
+
+SIZES = (1, 100, 10_000)
+INSTANCE = Instance("https://example.com")
+KEY_ID = "https://example.com/users/alice"
+
+
+def signed_mail(key: RSA.RsaKey):
+    data = json.dumps({"type": "Create", "to": ["https://example.com/users/bob"]})
+    digest = "sha-256=" + _do_digest(data)
+    date = "Sat, 18 Oct 2026 10:00:00 GMT"
+    signed_string = f"(request-target): post /users/bob/inbox\n" \
+                    f"digest: {digest}\n" \
+                    f"host: {INSTANCE.hostname}\n" \
+                    f"date: {date}"
+    return Mail(
+        headers={
+            "Digest": digest,
+            "Host": INSTANCE.hostname,
+            "Date": date,
+            "Signature": f'keyId="{KEY_ID}",headers="(request-target) digest host date",'
+                         f'signature="{_do_sign(signed_string, key)}"',
+        },
+        method="POST",
+        path="/users/bob/inbox",
+        content_type="application/activity+json",
+        data=data.encode(),
+    )
+
+
+def run(verifier: RequestsVerifier, mails: list[Mail], executor=None):
+    start = time.perf_counter()
+    if executor is None:
+        errors = [verifier.verify(INSTANCE, mail) for mail in mails]
+    else:
+        errors = verifier.verify_many(INSTANCE, mails, executor)
+    elapsed = time.perf_counter() - start
+    assert all(error is None for error in errors)
+    return len(mails) / elapsed
+
+
+def main():
+    key = RSA.generate(3072)
+    verifier = RequestsVerifier()
+    verifier.set_key(KEY_ID, key.public_key())
+    mail = signed_mail(key)
+    report = Report("verify", arguments().json)
+    with ThreadPoolExecutor() as threads, ProcessPoolExecutor() as processes:
+        for size in SIZES:
+            mails = [mail] * size
+            report.add(
+                f"{size}_mails",
+                sequential_per_s=run(verifier, mails),
+                threads_per_s=run(verifier, mails, threads),
+                processes_per_s=run(verifier, mails, processes),
+            )
+    report.write()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,3 +3,9 @@ import os
 
 class Environ:
     INSTANCE: str = os.environ.get("INSTANCE_URL", "127.0.0.1:5000")
+    INBOX_PATH: str = os.environ.get("INBOX_PATH")
+    KEYS_PATH: str = os.environ.get("KEYS_PATH")
+    LOG_SAMPLE_RATE: float = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+    LOG_JSON: bool = os.environ.get("LOG_JSON", "") == "1"
+    PROFILE: bool = os.environ.get("PROFILE", "") == "1"
+    PROFILE_DIR: str = os.environ.get("PROFILE_DIR")
@@ -1,4 +1,5 @@
 from .server import wrap_flask_app
+from .asgi import wrap_asgi_app
 from .actor import Actor
-from .client import register, post_note, wait_inbox, register_external
+from .client import register, post_note, post_notes, wait_inbox, iter_inbox, stream_inbox, register_external
 from .endpoints import *
@@ -1,9 +1,9 @@
 from typing import Any
 
-import requests
-
+from .actor_cache import ActorCache
 from .keys import load_key, load_key_pem, import_key
 from .instance import Instance
+from .transport import Transport, default_transport
 
 
 class Actor:
@@ -20,8 +20,18 @@ class Actor:
     def url(
             actor_url: str,
             private_key_path: str = None,
+            transport: Transport = None,
+            cache: ActorCache = None,
     ):
-        response = requests.get(actor_url, headers={"Accept": "application/activity+json"})
+        headers = {"Accept": "application/activity+json"}
+        if cache is not None:
+            entry = cache.fetch(actor_url, headers=headers, transport=transport)
+            if private_key_path is not None:
+                return Actor.json(entry.data, private_key_path)
+            if entry.actor is None:
+                entry.actor = Actor.json(entry.data)
+            return entry.actor
+        response = (transport or default_transport).get(actor_url, headers=headers)
         if response.status_code // 100 != 2:
             raise FileNotFoundError(response)
         return Actor.json(response.json(), private_key_path)
@@ -31,13 +41,17 @@ class Actor:
             username: str,
             instance: str = None,
             private_key_path: str = None,
+            transport: Transport = None,
+            cache: ActorCache = None,
     ):
         username, instance = _parse_username(username, instance)
-        response = requests.get(
-            f"{instance}/.well-known/webfinger",
-            params={"resource": f"acct:{username}@{instance.hostname}"}
-        )
-        for link in response.json().get("links", ()):
+        url = f"{instance}/.well-known/webfinger"
+        params = {"resource": f"acct:{username}@{instance.hostname}"}
+        if cache is not None:
+            data = cache.fetch(url, params=params, transport=transport).data
+        else:
+            data = (transport or default_transport).get(url, params=params).json()
+        for link in data.get("links", ()):
             if link.get("rel") == "self":
                 actor_url = link.get("href")
                 break
@@ -45,7 +59,7 @@ class Actor:
             actor_url = None
         if actor_url is None:
             raise FileNotFoundError(username)
-        return Actor.url(actor_url, private_key_path)
+        return Actor.url(actor_url, private_key_path, transport, cache)
 
     @staticmethod
     def phant(
@@ -78,6 +92,7 @@ class Actor:
         self.username = username
         self.instance = instance
         self.full_username = f"@{username}@{instance.hostname}"
+        self.private_key_path = private_key_path
         self.private_key = load_key(private_key_path)
         self.id = kwargs.get("id")
         self.inbox = kwargs.get("inbox")
@@ -0,0 +1,122 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode
+
+from .transport import Transport, default_transport
+
+
+class CacheEntry:
+    __slots__ = ("data", "etag", "expires", "actor")
+
+    def __init__(self, data: dict[str, Any] = None, etag: str = None, expires: float = 0):
+        self.data = data
+        self.etag = etag
+        self.expires = expires
+        self.actor = None
+
+
+class ActorCache:
+    def __init__(
+            self,
+            ttl: float = 3600,
+            negative_ttl: float = 300,
+            max_size: int = 10000,
+            snapshot_path: str = None,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.snapshot_path = snapshot_path
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        if snapshot_path is not None and Path(snapshot_path).exists():
+            self.load(snapshot_path)
+
+    def fetch(
+            self,
+            url: str,
+            params: dict[str, str] = None,
+            headers: dict[str, str] = None,
+            transport: Transport = None,
+    ) -> CacheEntry:
+        key = url if params is None else f"{url}?{urlencode(params)}"
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and entry.expires > now:
+            self.hits += 1
+            if entry.data is None:
+                raise FileNotFoundError(url)
+            return entry
+        self.misses += 1
+        headers = dict(headers or {})
+        if entry is not None and entry.etag is not None:
+            headers["If-None-Match"] = entry.etag
+        response = (transport or default_transport).get(url, params=params, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.revalidations += 1
+            entry.expires = now + _max_age(response.headers, self.ttl)
+            return entry
+        if response.status_code in (404, 410):
+            self._store(key, CacheEntry(expires=now + self.negative_ttl))
+            raise FileNotFoundError(url)
+        if response.status_code // 100 != 2:
+            raise FileNotFoundError(response)
+        entry = CacheEntry(response.json(), response.headers.get("ETag"), now + _max_age(response.headers, self.ttl))
+        if "no-store" not in response.headers.get("Cache-Control", ""):
+            self._store(key, entry)
+        return entry
+
+    def invalidate(self, url: str):
+        with self._lock:
+            self._entries.pop(url, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self, path: str = None):
+        path = Path(path or self.snapshot_path)
+        with self._lock:
+            snapshot = {
+                key: {"data": entry.data, "etag": entry.etag, "expires": entry.expires}
+                for key, entry in self._entries.items()
+            }
+        temporary_path = path.with_suffix(path.suffix + ".tmp")
+        with open(temporary_path, "w") as fp:
+            json.dump(snapshot, fp)
+        temporary_path.replace(path)
+
+    def load(self, path: str = None):
+        with open(path or self.snapshot_path) as fp:
+            snapshot = json.load(fp)
+        for key, item in snapshot.items():
+            self._store(key, CacheEntry(item["data"], item["etag"], item["expires"]))
+
+    def _store(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self)}>"
+
+
+def _max_age(headers, default: float) -> float:
+    match = re.search(r"max-age=(\d+)", headers.get("Cache-Control", ""))
+    return float(match.group(1)) if match is not None else default
@@ -0,0 +1,186 @@
+import asyncio
+import io
+import sys
+from collections.abc import Callable
+from concurrent.futures import Executor, ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from flask import Flask
+
+from .inbox import Inbox
+from .key_registry import KeyRegistry
+from .server import wrap_flask_app
+from .wsgi import MAX_BODY_SIZE
+
+WORKERS = 256
+WAIT_WORKERS = 1024
+
+
+class AsgiAdapter:
+    # Serves a WSGI app (the phant Flask app) from an ASGI server. The event loop only moves bytes, handlers
+    # (RSA verification, storage) run on the executor. Requests that park a thread while they wait (long polls and
+    # inbox streams, see is_waiting) run on wait_executor instead, so they can't starve the other requests. Waits
+    # are still blocking: each open long poll or stream holds one of its threads (WAIT_WORKERS by default), so that
+    # is how many can be served at once, further ones queue until a thread is free
+    def __init__(
+            self,
+            app: Callable,
+            executor: Executor = None,
+            max_body_size: int = MAX_BODY_SIZE,
+            wait_executor: Executor = None,
+            is_waiting: Callable[[dict], bool] = None,
+    ):
+        self.app = app
+        self.executor = executor or ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="phant-asgi")
+        self.wait_executor = wait_executor or ThreadPoolExecutor(
+            max_workers=WAIT_WORKERS, thread_name_prefix="phant-asgi-wait"
+        )
+        self.is_waiting = is_waiting or _is_waiting
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        else:
+            raise NotImplementedError(scope["type"])
+
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                self.wait_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope: dict, receive: Callable, send: Callable):
+        body = bytearray()
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if len(body) > self.max_body_size:
+                await _send_simple(send, 413, b"Request Entity Too Large")
+                return
+        loop = asyncio.get_running_loop()
+        executor = self.wait_executor if self.is_waiting(scope) else self.executor
+        response_start = {}
+
+        def start_response(status: str, headers: list[tuple[str, str]], exc_info=None):
+            response_start["status"] = int(status.split(" ", 1)[0])
+            response_start["headers"] = [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers]
+            return _unsupported_write
+
+        iterable = await loop.run_in_executor(executor, self.app, _environ(scope, bytes(body)), start_response)
+        iterator = iter(iterable)
+        disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            started = False
+            while True:
+                chunk = loop.run_in_executor(executor, next, iterator, None)
+                await asyncio.wait({chunk, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+                if not chunk.done():
+                    # The client went away while a streaming handler was still waiting for data
+                    chunk.add_done_callback(lambda _: executor.submit(_close, iterable))
+                    return
+                data = chunk.result()
+                if not started:
+                    await send({"type": "http.response.start", **response_start})
+                    started = True
+                if data is None:
+                    break
+                if len(data) > 0:
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            await loop.run_in_executor(executor, _close, iterable)
+        finally:
+            disconnect.cancel()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.app}>"
+
+
+def wrap_asgi_app(
+        instance: str,
+        inbox: Inbox = None,
+        executor: Executor = None,
+        key_registry: KeyRegistry = None,
+        wait_executor: Executor = None,
+) -> AsgiAdapter:
+    app = Flask(__name__)
+    wrap_flask_app(instance, app, inbox, key_registry=key_registry)
+    return AsgiAdapter(app, executor, wait_executor=wait_executor)
+
+
+def _environ(scope: dict, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _is_waiting(scope: dict) -> bool:
+    # GET /users/<user>/inbox/stream, and GET /users/<user>/inbox with a non-zero wait, with or without the
+    # trailing slash every endpoint also accepts
+    if scope["method"] != "GET":
+        return False
+    path = scope["path"].rstrip("/")
+    if path.endswith("/inbox/stream"):
+        return True
+    if not path.endswith("/inbox"):
+        return False
+    wait = parse_qs(scope.get("query_string", b"").decode("latin1")).get("wait", ["0"])[-1]
+    try:
+        return float(wait) > 0
+    except ValueError:
+        return False
+
+
+async def _wait_disconnect(receive: Callable):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_simple(send: Callable, status: int, body: bytes):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _close(iterable):
+    if hasattr(iterable, "close"):
+        iterable.close()
+
+
+def _unsupported_write(data: bytes):
+    raise NotImplementedError("The WSGI write() callable is not supported")
@@ -1,84 +1,218 @@
 import base64
 import datetime
+import email.utils
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional, Union
 
 import Crypto.Hash.SHA256
+import Crypto.PublicKey.ECC
+import Crypto.PublicKey.RSA
+import Crypto.Signature.eddsa
 import Crypto.Signature.pkcs1_15
-import requests
+from Crypto.PublicKey.ECC import EccKey
 from Crypto.PublicKey.RSA import RsaKey
 
 from .actor import Actor
 from .datatypes import Request
-from .instance import Instance
+from .instance import EndpointUrl, Instance
+from .key_registry import KeyRegistry, MemoryKeyRegistry
+from .keys import Key, export_key_pem, import_key
+from .metrics import outbound_latency, verify_latency
+from .profiling import profiler
+from .transport import Transport, default_transport
+from .wsgi import BODY_DIGEST
 
 
 def signed_request(
         method: str,
         endpoint: str,
         sender: Actor,
-        content: str = "",
+        content: Union[str, bytes] = "",
         date: datetime.datetime = None,
+        transport: Transport = None,
         **kwargs
 ):
-    url = Instance(endpoint)
+    if isinstance(content, str):
+        # Encoded once, the same bytes are digested and sent
+        content = content.encode()
+    if "headers" in kwargs:
+        headers = kwargs["headers"]
+        del kwargs["headers"]
+    else:
+        headers = {}
+    with profiler.stage("sign"):
+        headers = dict(headers, **signed_headers(method, endpoint, sender, content, date))
+    start = time.perf_counter()
+    status = "error"
+    try:
+        with profiler.stage("send"):
+            response = (transport or default_transport).request(
+                method, endpoint, data=content, headers=headers, **kwargs
+            )
+        status = str(response.status_code)
+        return response
+    finally:
+        outbound_latency.observe(time.perf_counter() - start, method, status)
+
+
+def signed_headers(
+        method: str,
+        endpoint: str,
+        sender: Actor,
+        content: Union[str, bytes] = "",
+        date: datetime.datetime = None,
+) -> dict[str, str]:
+    url = EndpointUrl.parse(endpoint)
     date = (date or datetime.datetime.utcnow()).strftime("%a, %d %b %Y %H:%M:%S GMT")
     digest = "sha-256=" + _do_digest(content)
     signed_string = f"(request-target): {method.lower()} {url.path}\n" \
                     f"digest: {digest}\n" \
                     f"host: {url.hostname}\n" \
                     f"date: {date}"
+    # RSA headers stay unchanged for interop, other keys name the algorithm
+    algorithm = '' if isinstance(sender.private_key, RsaKey) else 'algorithm="hs2019",'
     signature_header = f'keyId="{sender.public_key_id}",' \
+                       f'{algorithm}' \
                        f'headers="(request-target) digest host date",' \
                        f'signature="{_do_sign(signed_string, sender.private_key)}"'
-    if "headers" in kwargs:
-        headers = kwargs["headers"]
-        del kwargs["headers"]
-    else:
-        headers = {}
-    return requests.request(method, endpoint, data=content, headers=dict(
-        headers,
-        Digest=digest,
-        Host=url.hostname,
-        Date=date,
-        Signature=signature_header
-    ), **kwargs)
+    return {
+        "Digest": digest,
+        "Host": url.hostname,
+        "Date": date,
+        "Signature": signature_header,
+    }
 
 
 class RequestsVerifier:
-    def __init__(self):
-        self._keys = {}
+    def __init__(
+            self,
+            cache_size: int = 0,
+            cache_ttl: float = 3600,
+            registry: KeyRegistry = None,
+            key_cache_size: int = 1024,
+            key_cache_ttl: float = 60,
+    ):
+        self.registry = registry or MemoryKeyRegistry()
+        self.key_cache_size = key_cache_size
+        self.key_cache_ttl = key_cache_ttl
+        # Read-through cache of the registry: keyId -> (key, pem, expires)
+        self._keys: OrderedDict[str, tuple[Optional[Key], str, float]] = OrderedDict()
+        self._keys_lock = threading.Lock()
+        self._cache: OrderedDict[tuple[str, str, str], float] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def set_key(self, public_key_id: str, public_key: Optional[Key]):
+        pem = "" if public_key is None else export_key_pem(public_key.public_key())
+        self._lookup(public_key_id)
+        self.registry.set(public_key_id, pem)
+        self._store_key(public_key_id, public_key, pem)
 
-    def set_key(self, public_key_id: str, public_key: RsaKey):
-        self._keys[public_key_id] = public_key
+    def get_key(self, public_key_id: str) -> Optional[Key]:
+        entry = self._lookup(public_key_id)
+        if entry is None:
+            raise KeyError(public_key_id)
+        return entry[0]
 
-    def get_key(self, public_key_id: str):
-        return self._keys[public_key_id]
+    def get_key_pem(self, public_key_id: str) -> str:
+        entry = self._lookup(public_key_id)
+        if entry is None:
+            raise KeyError(public_key_id)
+        return entry[1]
 
     def verify(self, instance: Instance, request: Request):
+        start = time.perf_counter()
+        error, pending = self._prepare(instance, request)
+        if pending is not None:
+            with profiler.stage("verify_signature"):
+                valid = _do_verify(pending.signed_string, pending.signature, pending.public_key)
+            error = self._conclude(pending, valid)
+        verify_latency.observe(time.perf_counter() - start)
+        return error
+
+    def verify_many(
+            self,
+            instance: Instance,
+            mails: Iterable[Request],
+            executor: Executor = None,
+            chunksize: int = 64,
+    ) -> list:
+        errors = []
+        pending = []
+        for mail in mails:
+            error, verification = self._prepare(instance, mail)
+            errors.append(error)
+            if verification is not None:
+                pending.append((len(errors) - 1, verification))
+        if executor is None:
+            results = (_do_verify(item.signed_string, item.signature, item.public_key) for _, item in pending)
+        elif isinstance(executor, ThreadPoolExecutor):
+            # Threads share the key objects, only process pools need them rebuilt
+            results = executor.map(
+                _do_verify,
+                [item.signed_string for _, item in pending],
+                [item.signature for _, item in pending],
+                [item.public_key for _, item in pending],
+            )
+        else:
+            results = executor.map(
+                _verify_task,
+                [item.signed_string for _, item in pending],
+                [item.signature for _, item in pending],
+                [_public_numbers(item.public_key) for _, item in pending],
+                chunksize=chunksize,
+            )
+        for (index, item), valid in zip(pending, results):
+            errors[index] = self._conclude(item, valid)
+        return errors
+
+    def _prepare(self, instance: Instance, request: Request) -> tuple[Any, Optional['_PendingVerification']]:
         for header in ("Digest", "Host", "Date", "Signature"):
             if header not in request.headers:
-                return f"Missing Header: {header}", 401
+                return (f"Missing Header: {header}", 401), None
         if request.headers["Host"] != instance.hostname:
-            return f"Invalid Host Header: {request.headers['Host']} should be {instance.hostname}", 401
+            return (f"Invalid Host Header: {request.headers['Host']} should be {instance.hostname}", 401), None
         parts = request.headers["Digest"].split('=', maxsplit=1)
         if len(parts) != 2:
-            return f"Invalid Digest Header"
+            return ("Invalid Digest Header", 401), None
         if parts[0].lower() != "sha-256":
-            return f"Digest Header uses {parts[0]} instead of sha-256", 401
-        digest = _do_digest(request.data.decode())
+            return (f"Digest Header uses {parts[0]} instead of sha-256", 401), None
+        digest = _body_digest(request)
         if parts[1] != digest:
-            return f"Invalid Header: Digest", 401
+            return (f"Invalid Header: Digest", 401), None
+        with profiler.stage("header_parse"):
+            return self._prepare_signature(instance, request)
+
+    def _prepare_signature(
+            self,
+            instance: Instance,
+            request: Request,
+    ) -> tuple[Any, Optional['_PendingVerification']]:
         signature_fields = {}
         for field in request.headers["Signature"].split(","):
             item = field.split("=", maxsplit=1)
             if len(item) != 2 or len(item[1]) < 2 or not item[1].startswith('"') or not item[1].endswith('"'):
-                return "Invalid field in Signature Header: " + request.headers["Signature"], 401
+                return ("Invalid field in Signature Header: " + request.headers["Signature"], 401), None
             signature_fields[item[0]] = item[1][1:-1]
         for field in ("keyId", "headers", "signature"):
             if field not in signature_fields:
-                return f"Missing field in Signature header: {field}", 401
-        public_key = self._keys.get(signature_fields["keyId"])
+                return (f"Missing field in Signature header: {field}", 401), None
+        entry = self._lookup(signature_fields["keyId"])
+        public_key = None if entry is None else entry[0]
         if public_key is None:
-            return "No available key for actor " + signature_fields["keyId"], 401
+            return ("No available key for actor " + signature_fields["keyId"], 401), None
+        algorithm = signature_fields.get("algorithm", "hs2019")
+        if algorithm not in _ALGORITHMS or _key_algorithm(public_key) not in _ALGORITHMS[algorithm]:
+            return (f"Unsupported algorithm in Signature header: {algorithm}", 401), None
         signed_string = []
         for header in signature_fields["headers"].split(" "):
             if header == "(request-target)":
@@ -92,35 +226,171 @@ class RequestsVerifier:
             elif header == "content-type":
                 signed_string.append(f"content-type: {request.content_type}")
             else:
-                return f"Invalid header name in field headers of Signature header: {header}", 401
+                return (f"Invalid header name in field headers of Signature header: {header}", 401), None
         signed_string = "\n".join(signed_string)
-        if not _do_verify(signed_string, signature_fields["signature"], public_key):
+        cache_key = (signature_fields["keyId"], signed_string, signature_fields["signature"])
+        if self._cache_get(cache_key):
+            return None, None
+        return None, _PendingVerification(
+            cache_key,
+            request.headers["Date"],
+            signed_string,
+            signature_fields["signature"],
+            public_key,
+        )
+
+    def _conclude(self, pending: '_PendingVerification', valid: bool):
+        if not valid:
             return "Invalid signature", 403
+        self._cache_set(pending.cache_key, pending.date)
+
+    def _lookup(self, public_key_id: str) -> Optional[tuple[Optional[Key], str, float]]:
+        with self._keys_lock:
+            entry = self._keys.get(public_key_id)
+            if entry is not None and entry[2] > time.monotonic():
+                self._keys.move_to_end(public_key_id)
+                return entry
+        pem = self.registry.get(public_key_id)
+        if pem is None:
+            with self._keys_lock:
+                self._keys.pop(public_key_id, None)
+            return None
+        try:
+            public_key = import_key(pem)
+        except ValueError:
+            # Saved before unsupported keys were refused at import, treated as no key
+            public_key = None
+        return self._store_key(public_key_id, public_key, pem)
+
+    def _store_key(self, public_key_id: str, public_key: Optional[Key], pem: str) -> tuple[Optional[Key], str, float]:
+        entry = (public_key, pem, time.monotonic() + self.key_cache_ttl)
+        with self._keys_lock:
+            old_entry = self._keys.get(public_key_id)
+            self._keys[public_key_id] = entry
+            self._keys.move_to_end(public_key_id)
+            while len(self._keys) > self.key_cache_size:
+                self._keys.popitem(last=False)
+        if old_entry is not None and old_entry[1] != pem:
+            # The key was replaced, possibly by another worker: signatures made with the old one are no longer valid
+            with self._cache_lock:
+                for key in [key for key in self._cache if key[0] == public_key_id]:
+                    del self._cache[key]
+        return entry
+
+    def _cache_get(self, cache_key: tuple[str, str, str]) -> bool:
+        if self.cache_size <= 0:
+            return False
+        with self._cache_lock:
+            expires = self._cache.get(cache_key)
+            if expires is not None and expires > time.time():
+                self._cache.move_to_end(cache_key)
+                self.cache_hits += 1
+                return True
+            elif expires is not None:
+                del self._cache[cache_key]
+            self.cache_misses += 1
+            return False
+
+    def _cache_set(self, cache_key: tuple[str, str, str], date: str):
+        if self.cache_size <= 0:
+            return
+        try:
+            expires = email.utils.parsedate_to_datetime(date).timestamp() + self.cache_ttl
+        except (TypeError, ValueError):
+            return
+        if expires <= time.time():
+            return
+        with self._cache_lock:
+            self._cache[cache_key] = expires
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+class _PendingVerification(NamedTuple):
+    cache_key: tuple[str, str, str]
+    date: str
+    signed_string: str
+    signature: str
+    public_key: Key
+
+
+# hs2019 leaves the algorithm to the key, the legacy names pin it
+_ALGORITHMS = {
+    "hs2019": ("rsa-sha256", "ed25519"),
+    "rsa-sha256": ("rsa-sha256",),
+    "ed25519": ("ed25519",),
+}
 
 
-def _do_sign(value: str, private_key: RsaKey) -> str:
+def _key_algorithm(key: Key) -> Optional[str]:
+    if isinstance(key, RsaKey):
+        return "rsa-sha256"
+    if isinstance(key, EccKey) and key.curve == "Ed25519":
+        return "ed25519"
+    return None
+
+
+def _public_numbers(public_key: Key) -> tuple:
+    # Keys can't be pickled, so process pools receive what is needed to rebuild them
+    if isinstance(public_key, RsaKey):
+        return public_key.n, public_key.e
+    return (public_key.export_key(format="DER"),)
+
+
+def _verify_task(value: str, signature: str, public_numbers: tuple):
+    return _do_verify(value, signature, _task_key(public_numbers))
+
+
+@lru_cache(maxsize=1024)
+def _task_key(public_numbers: tuple) -> Key:
+    # Each worker process keeps the keys it rebuilt, bounded like the verifier's own key cache
+    if len(public_numbers) == 1:
+        return Crypto.PublicKey.ECC.import_key(public_numbers[0])
+    return Crypto.PublicKey.RSA.construct(public_numbers)
+
+
+def _do_sign(value: str, private_key: Key) -> str:
+    if isinstance(private_key, EccKey):
+        signer = Crypto.Signature.eddsa.new(private_key, "rfc8032")
+        return base64.b64encode(signer.sign(value.encode())).decode()
     value = _do_hash(value)
     signer = Crypto.Signature.pkcs1_15.new(private_key)
     return base64.b64encode(signer.sign(value)).decode()
 
 
-def _do_verify(value: str, signature: str, public_key: RsaKey):
-    hasher = _do_hash(value)
+def _do_verify(value: str, signature: str, public_key: Key):
     signature = base64.b64decode(signature)
-    signer = Crypto.Signature.pkcs1_15.new(public_key)
     try:
-        signer.verify(hasher, signature)
+        if isinstance(public_key, EccKey):
+            message = value.encode()
+            signer = Crypto.Signature.eddsa.new(public_key, "rfc8032")
+        else:
+            message = _do_hash(value)
+            signer = Crypto.Signature.pkcs1_15.new(public_key)
+        signer.verify(message, signature)
         return True
     except ValueError:
         return False
 
 
-def _do_digest(value: str) -> str:
-    hasher = _do_hash(value)
-    return base64.b64encode(hasher.digest()).decode()
+def _body_digest(request: Request) -> str:
+    data = request.data
+    # Flask requests served through wrap_flask_app were already hashed while the body was read
+    body = getattr(request, "environ", {}).get(BODY_DIGEST)
+    if body is not None and body.size == len(data):
+        return body.digest()
+    return _do_digest(data)
+
+
+def _do_digest(value: Union[str, bytes, memoryview]) -> str:
+    with profiler.stage("digest"):
+        if isinstance(value, str):
+            value = value.encode()
+        return base64.b64encode(hashlib.sha256(value).digest()).decode()
 
 
-def _do_hash(value: str):
+def _do_hash(value: Union[str, bytes, memoryview]):
     hasher = Crypto.Hash.SHA256.new()
-    hasher.update(value.encode())
+    hasher.update(value.encode() if isinstance(value, str) else value)
     return hasher
@@ -1,16 +1,25 @@
 import datetime
 import json
-from typing import Any
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Union
 from uuid import uuid4
 
-import requests
-
 from .actor import Actor
+from .actor_cache import ActorCache
 from .auth import signed_request, RequestsVerifier
 from .datatypes import Mail
 from .instance import Instance
+from .keys import export_key_pem
+from .outbox import Outbox
+from .serialization import dumps
+from .templates import CREATE, NOTE, fill, render_note, render_notes
+from .transport import Transport, default_transport
 
-client_verifier = RequestsVerifier()
+client_verifier = RequestsVerifier(cache_size=4096)
+verify_executor = ThreadPoolExecutor()
+VERIFY_BATCH_THRESHOLD = 16
 
 
 def register(
@@ -18,13 +27,15 @@ def register(
         instance: str = None,
         *,
         public_key_path: str,
-        private_key_path: str
+        private_key_path: str,
+        transport: Transport = None,
 ):
+    transport = transport or default_transport
     actor = Actor.phant(username, instance, public_key_path=public_key_path)
-    response = requests.post(actor.id, actor.public_key.export_key())
+    response = transport.post(actor.id, export_key_pem(actor.public_key))
     if response.status_code // 100 != 2:
         raise RuntimeError("Unable to register actor.")
-    actor = Actor.url(actor.id, private_key_path=private_key_path)
+    actor = Actor.url(actor.id, private_key_path=private_key_path, transport=transport)
     client_verifier.set_key(actor.public_key_id, actor.public_key)
     return actor
 
@@ -33,50 +44,142 @@ def register_external(
         host_instance: str,
         username: str,
         instance: str = None,
+        transport: Transport = None,
+        cache: ActorCache = None,
 ):
-    actor = Actor.webfinger(username, instance)
-    response = requests.post(f"{Instance(host_instance)}/external_keys", json=actor.json)
+    transport = transport or default_transport
+    actor = Actor.webfinger(username, instance, transport=transport, cache=cache)
+    response = transport.post(f"{Instance(host_instance)}/external_keys", json=actor.json)
     if response.status_code // 100 != 2:
         raise RuntimeError("Unable to register external actor.")
     client_verifier.set_key(actor.public_key_id, actor.public_key)
     return actor
 
 
-def get_inbox(actor: Actor) -> list[dict[str, Any]]:
+def get_inbox(
+        actor: Actor,
+        encoding: str = "base64",
+        wait: float = 0,
+        transport: Transport = None,
+) -> list[dict[str, Any]]:
+    transport = transport or default_transport
+    params = {"encoding": encoding}
+    if wait > 0:
+        params["wait"] = wait
     response = signed_request(
         method="GET",
         endpoint=actor.inbox,
-        sender=actor
+        sender=actor,
+        transport=transport,
+        params=params,
+        timeout=(transport.connect_timeout, transport.read_timeout + wait),
     )
     if response.status_code // 100 != 2:
         raise RuntimeError("Unable to get inbox.", actor, response)
-    valid_mails = []
-    for mail in [Mail(**item) for item in response.json()]:
-        error = client_verifier.verify(actor.instance, mail)
-        if error is None:
-            valid_mails.append(mail.content)
-    return valid_mails
+    return _verify_mails(actor, response.json())
+
 
+def iter_inbox(
+        actor: Actor,
+        limit: int = 100,
+        encoding: str = "base64",
+        wait: float = 0,
+        transport: Transport = None,
+) -> Iterator[dict[str, Any]]:
+    transport = transport or default_transport
+    params = {"encoding": encoding, "since": 0, "limit": limit}
+    if wait > 0:
+        params["wait"] = wait
+    while True:
+        response = signed_request(
+            method="GET",
+            endpoint=actor.inbox,
+            sender=actor,
+            transport=transport,
+            params=params,
+            timeout=(transport.connect_timeout, transport.read_timeout + wait),
+        )
+        if response.status_code // 100 != 2:
+            raise RuntimeError("Unable to get inbox.", actor, response)
+        page = response.json()
+        if len(page["items"]) == 0:
+            return
+        yield from _verify_mails(actor, page["items"])
+        # The page is acknowledged with the next request, once it has been consumed
+        params["since"] = params["ack"] = page["cursor"]
 
-def wait_inbox(actor: Actor):
-    inbox = ()
-    while len(inbox) == 0:
-        inbox = get_inbox(actor)
-    return inbox
+
+def stream_inbox(
+        actor: Actor,
+        encoding: str = "base64",
+        transport: Transport = None,
+) -> Iterator[dict[str, Any]]:
+    response = signed_request(
+        method="GET",
+        endpoint=f"{actor.inbox}/stream",
+        sender=actor,
+        transport=transport,
+        params={"encoding": encoding},
+        stream=True,
+    )
+    if response.status_code // 100 != 2:
+        raise RuntimeError("Unable to stream inbox.", actor, response)
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line.startswith("data:"):
+                continue
+            mail = Mail(**json.loads(line[5:]))
+            error = client_verifier.verify(actor.instance, mail)
+            if error is None:
+                yield mail.content
+
+
+def wait_inbox(
+        actor: Actor,
+        timeout: float = None,
+        wait: float = 30,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        transport: Transport = None,
+):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    delay = backoff
+    while True:
+        poll = wait if deadline is None else max(0, min(wait, deadline - time.monotonic()))
+        start = time.monotonic()
+        inbox = get_inbox(actor, wait=poll, transport=transport)
+        if len(inbox) > 0:
+            return inbox
+        # Only a fetch made at or past the deadline that came back empty times out, so waiting mail is always seen
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(actor)
+        if poll == 0 or time.monotonic() - start < poll:
+            # The server answered before the wait expired (e.g. no long-poll support)
+            time.sleep(delay if deadline is None else max(0, min(delay, deadline - time.monotonic())))
+            delay = min(delay * 2, max_backoff)
+        else:
+            delay = backoff
 
 
 def post_activity(
-        activity: dict[str, Any],
+        activity: Union[dict[str, Any], bytes],
         sender: Actor,
         recipient: Actor,
         date: datetime.datetime = None,
+        transport: Transport = None,
+        outbox: Outbox = None,
 ):
+    content = activity if isinstance(activity, bytes) else dumps(activity)
+    if outbox is not None:
+        outbox.enqueue(content, sender, recipient.inbox)
+        return
     response = signed_request(
         method="POST",
         endpoint=recipient.inbox,
-        content=json.dumps(activity),
+        content=content,
         sender=sender,
         date=date,
+        transport=transport,
     )
     if response.status_code // 100 != 2:
         raise RuntimeError("Unable to post activity.", response)
@@ -86,34 +189,18 @@ def post_activity_create(
         object_activity: dict[str, Any],
         sender: Actor,
         recipient: Actor,
-        date: datetime.datetime = None
+        date: datetime.datetime = None,
+        transport: Transport = None,
+        outbox: Outbox = None,
 ):
     date = date or datetime.datetime.now()
     return post_activity(
-        activity={
-            "@context": [
-                "https://www.w3.org/ns/activitystreams",
-                {
-                    "ostatus": "http://ostatus.org#",
-                    "atomUri": "ostatus:atomUri",
-                    "inReplyToAtomUri": "ostatus:inReplyToAtomUri",
-                    "conversation": "ostatus:conversation",
-                    "sensitive": "as:sensitive",
-                    "toot": "http://joinmastodon.org/ns#",
-                    "votersCount": "toot:votersCount"
-                }
-            ],
-            "id": generate_id(sender),
-            "type": "Create",
-            "actor": sender.id,
-            "published": date.strftime("%Y-%m-%dT%H:%M:%SZ"),
-            "to": [recipient.id],
-            "cc": [],
-            "object": object_activity
-        },
+        activity=build_create(object_activity, sender, [recipient], date),
         sender=sender,
         recipient=recipient,
         date=date,
+        transport=transport,
+        outbox=outbox,
     )
 
 
@@ -126,54 +213,90 @@ def post_note(
         in_reply_to: str = None,
         in_reply_to_atom_uri: str = None,
         sensitive: bool = False,
+        transport: Transport = None,
+        outbox: Outbox = None,
 ):
-    id_convo = uuid4().fields[0]
-    id_note = generate_id(sender, id_convo)
     date = date or datetime.datetime.now()
-    return post_activity_create(
-        object_activity={
-            "id": id_note,
-            "type": "Note",
-            "summary": summary,
-            "inReplyTo": in_reply_to,
-            "published": date.strftime("%Y-%m-%dT%H:%M:%SZ"),
-            "url": id_note,
-            "attributedTo": sender.id,
-            "to": [recipient.id],
-            "cc": [],
-            "sensitive": sensitive,
-            "atomUri": id_note,
-            "inReplyToAtomUri": in_reply_to_atom_uri,
-            "conversation": f"tag:{sender.instance},{date.strftime('%Y-%m-%d')}:"
-                            f"objectId={id_convo}:"
-                            f"objectType=Conversation",
-            "content": content,
-            "contentMap": {},
-            "attachment": [],
-            "tag": [
-                {
-                    "type": "Mention",
-                    "href": recipient.id,
-                    "name": recipient.full_username
-                }
-            ],
-            "replies": {
-                "id": id_note,
-                "type": "Collection",
-                "first": {
-                    "type": "CollectionPage",
-                    "next": id_note,
-                    "partOf": id_note,
-                    "items": []
-                }
-            }
-        },
+    return post_activity(
+        activity=render_note(content, sender, [recipient], date, summary, in_reply_to, in_reply_to_atom_uri, sensitive),
         sender=sender,
         recipient=recipient,
         date=date,
+        transport=transport,
+        outbox=outbox,
     )
 
 
+def post_notes(
+        contents: Iterable[str],
+        sender: Actor,
+        recipient: Actor,
+        date: datetime.datetime = None,
+        summary: str = None,
+        sensitive: bool = False,
+        transport: Transport = None,
+        outbox: Outbox = None,
+):
+    date = date or datetime.datetime.now()
+    for activity in render_notes(contents, sender, [recipient], date, summary, sensitive=sensitive):
+        post_activity(activity, sender, recipient, date, transport, outbox)
+
+
+def build_create(
+        object_activity: dict[str, Any],
+        sender: Actor,
+        recipients: list[Actor],
+        date: datetime.datetime,
+):
+    return fill(
+        CREATE,
+        create_id=generate_id(sender),
+        actor=sender.id,
+        published=date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        to=[recipient.id for recipient in recipients],
+        object=object_activity,
+    )
+
+
+def build_note(
+        content: str,
+        sender: Actor,
+        recipients: list[Actor],
+        date: datetime.datetime,
+        summary: str = None,
+        in_reply_to: str = None,
+        in_reply_to_atom_uri: str = None,
+        sensitive: bool = False,
+):
+    id_convo = uuid4().fields[0]
+    return fill(
+        NOTE,
+        id=generate_id(sender, id_convo),
+        summary=summary,
+        in_reply_to=in_reply_to,
+        published=date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        actor=sender.id,
+        to=[recipient.id for recipient in recipients],
+        sensitive=sensitive,
+        in_reply_to_atom_uri=in_reply_to_atom_uri,
+        conversation=f"tag:{sender.instance},{date.strftime('%Y-%m-%d')}:objectId={id_convo}:objectType=Conversation",
+        content=content,
+        tag=[
+            {"type": "Mention", "href": recipient.id, "name": recipient.full_username}
+            for recipient in recipients
+        ],
+    )
+
+
+def _verify_mails(actor: Actor, items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    mails = [Mail(**item) for item in items]
+    if len(mails) > VERIFY_BATCH_THRESHOLD:
+        errors = client_verifier.verify_many(actor.instance, mails, verify_executor)
+    else:
+        errors = [client_verifier.verify(actor.instance, mail) for mail in mails]
+    return [mail.content for mail, error in zip(mails, errors) if error is None]
+
+
 def generate_id(actor: Actor, id: int = None):
     id = id or uuid4().fields[0]
     return f"{actor.id}/{id}"
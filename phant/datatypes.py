@@ -1,6 +1,8 @@
-import json
+import base64
 from typing import Protocol
 
+from .serialization import loads
+
 
 class Request(Protocol):
     headers: dict[str, str]
@@ -11,6 +13,9 @@ class Request(Protocol):
 
 
 class Mail:
+    __slots__ = ("headers", "method", "path", "content_type", "data")
+    encodings = ("array", "base64")
+
     def __init__(
             self,
             headers: dict[str, str],
@@ -19,31 +24,39 @@ class Mail:
             content_type: str,
             data: bytes = None,
             data_array: list[int] = None,
+            data_base64: str = None,
     ):
-        self._data_array = data_array
         self.headers = headers
         self.method = method
         self.path = path
         self.content_type = content_type
-        self.data = data if data is not None else bytes(data_array)
+        if data is not None:
+            self.data = bytes(data)
+        elif data_base64 is not None:
+            self.data = base64.b64decode(data_base64)
+        else:
+            self.data = bytes(data_array)
 
     @property
     def data_array(self):
-        if self._data_array is not None:
-            return self._data_array
-        else:
-            return list(self.data)
+        return list(self.data)
+
+    @property
+    def data_base64(self):
+        return base64.b64encode(self.data).decode()
 
     @property
     def content(self):
-        return json.loads(self.data.decode())
+        return loads(self.data)
 
-    def to_dict(self):
+    def to_dict(self, encoding: str = "array"):
+        if encoding not in self.encodings:
+            raise ValueError(encoding)
         return {
             "headers": self.headers,
             "method": self.method,
             "path": self.path,
-            "data_array": self.data_array,
+            f"data_{encoding}": getattr(self, f"data_{encoding}"),
             "content_type": self.content_type,
         }
 
@@ -0,0 +1,83 @@
+import asyncio
+import datetime
+from typing import Any, NamedTuple, Optional, Union
+
+import aiohttp
+
+from .actor import Actor
+from .auth import signed_headers
+from .instance import EndpointUrl
+from .serialization import dumps
+from .templates import render_note
+
+
+class DeliveryResult(NamedTuple):
+    recipient: Actor
+    status: Optional[int]
+    error: Optional[BaseException]
+
+    @property
+    def ok(self):
+        return self.error is None and self.status // 100 == 2
+
+
+async def post_activity_many(
+        activity: Union[dict[str, Any], bytes],
+        sender: Actor,
+        recipients: list[Actor],
+        date: datetime.datetime = None,
+        limit: int = 100,
+        limit_per_host: int = 8,
+        timeout: float = 30,
+) -> list[DeliveryResult]:
+    content = activity if isinstance(activity, bytes) else dumps(activity)
+    date = date or datetime.datetime.utcnow()
+    loop = asyncio.get_running_loop()
+    # Content and date are shared by the whole batch, so the signature only depends on the inbox (path, host)
+    signatures: dict[EndpointUrl, asyncio.Future] = {}
+    deliveries: dict[str, asyncio.Task] = {}
+
+    async def deliver(session: aiohttp.ClientSession, inbox: str):
+        url = EndpointUrl.parse(inbox)
+        if url not in signatures:
+            signatures[url] = loop.run_in_executor(None, signed_headers, "POST", inbox, sender, content, date)
+        headers = await signatures[url]
+        async with session.post(inbox, data=content, headers=headers) as response:
+            await response.read()
+            return response.status
+
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        for recipient in recipients:
+            if recipient.inbox not in deliveries:
+                deliveries[recipient.inbox] = asyncio.create_task(deliver(session, recipient.inbox))
+        await asyncio.gather(*deliveries.values(), return_exceptions=True)
+    results = []
+    for recipient in recipients:
+        task = deliveries[recipient.inbox]
+        if task.exception() is not None:
+            results.append(DeliveryResult(recipient, None, task.exception()))
+        else:
+            results.append(DeliveryResult(recipient, task.result(), None))
+    return results
+
+
+async def post_note_many(
+        content: str,
+        sender: Actor,
+        recipients: list[Actor],
+        date: datetime.datetime = None,
+        summary: str = None,
+        in_reply_to: str = None,
+        in_reply_to_atom_uri: str = None,
+        sensitive: bool = False,
+        **kwargs
+) -> list[DeliveryResult]:
+    date = date or datetime.datetime.now()
+    return await post_activity_many(
+        activity=render_note(content, sender, recipients, date, summary, in_reply_to, in_reply_to_atom_uri, sensitive),
+        sender=sender,
+        recipients=recipients,
+        date=date,
+        **kwargs
+    )
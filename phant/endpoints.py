@@ -1,15 +1,28 @@
 import json
-from collections import defaultdict
+from typing import Any, Optional
 from urllib.parse import urlparse
 
-from Crypto.PublicKey import RSA
-from flask import request
+from flask import Response, request
 
 from .actor import Actor
 from .datatypes import Mail
-from .server import endpoint, phant_instance, server_verifier
+from .instance import Instance
+from .keys import import_key, same_key
+from .metrics import Gauge, registry
+from .profiling import profiler
+from .server import endpoint, phant_instance, phant_inbox, server_verifier
 
-global_inbox: dict[str, list[Mail]] = defaultdict(list)
+# Waiting requests hold a server thread: serve with threaded workers whose timeout is above this (see Dockerfile)
+MAX_INBOX_WAIT = 60.0
+MAX_INBOX_PAGE = 500
+STREAM_HEARTBEAT = 15.0
+
+registry.register(Gauge(
+    "phant_inbox_depth",
+    "Mails waiting in each user's inbox.",
+    ("user",),
+    lambda: {(user,): depth for user, depth in phant_inbox[0].depths().items()},
+))
 
 
 @endpoint("/.well-known/webfinger")
@@ -62,10 +75,13 @@ def get_user(user: str):
             "type": "Person",
             "preferredUsername": user,
             "inbox": inbox,
+            "endpoints": {
+                "sharedInbox": f"{phant_instance[0]}/inbox"
+            },
             "publicKey": {
                 "id": id,
                 "owner": id,
-                "publicKeyPem": public_key.public_key().export_key().decode()
+                "publicKeyPem": server_verifier.get_key_pem(id)
             }
         }
     else:
@@ -77,7 +93,12 @@ def get_user(user: str):
 @endpoint('/users/<user>', methods=("POST",))
 def register_user(user: str):
     id = get_phant_id(user)
-    public_key = RSA.import_key(request.data.decode())
+    try:
+        public_key = import_key(request.data.decode())
+    except ValueError as e:
+        return f"Invalid public key: {e}", 422
+    if public_key is None:
+        return "Missing public key", 422
     try:
         old_public_key_pem = server_verifier.get_key(id)
     except KeyError:
@@ -85,29 +106,81 @@ def register_user(user: str):
     else:
         if old_public_key_pem is None:
             server_verifier.set_key(id, public_key)
-        elif old_public_key_pem != public_key:
+        elif not same_key(old_public_key_pem, public_key):
             return "User Already Exists", 409
 
 
 @endpoint('/external_keys', methods=("POST",))
 def register_external_user():
-    actor = Actor.json(request.json)
+    try:
+        actor = Actor.json(request.json)
+    except ValueError as e:
+        return f"Invalid actor: {e}", 422
     server_verifier.set_key(actor.public_key_id, actor.public_key)
 
 
 @endpoint("/users/<user>/inbox", signed=True)
-def inbox_get(user: str):
-    inbox = tuple(global_inbox[user])
-    global_inbox[user].clear()
-    return list(inbox)
+def inbox_get(
+        user: str,
+        encoding: str = "array",
+        wait: str = "0",
+        since: str = None,
+        limit: str = None,
+        ack: str = None,
+):
+    if encoding not in Mail.encodings:
+        return f"Invalid encoding: {encoding}", 422
+    try:
+        timeout = float(wait)
+    except ValueError:
+        return f"Invalid wait: {wait}", 422
+    if not 0 <= timeout <= MAX_INBOX_WAIT:
+        return f"Parameter 'wait' should be between 0 and {MAX_INBOX_WAIT}.", 422
+    if since is None and limit is None and ack is None:
+        return [mail.to_dict(encoding) for mail in phant_inbox[0].take(user, timeout)]
+    try:
+        ack = None if ack is None else int(ack)
+        since = int(since) if since is not None else ack or 0
+        limit = MAX_INBOX_PAGE if limit is None else int(limit)
+    except ValueError:
+        return "Parameters 'since', 'limit' and 'ack' should be integers.", 422
+    if not 0 < limit <= MAX_INBOX_PAGE:
+        return f"Parameter 'limit' should be between 1 and {MAX_INBOX_PAGE}.", 422
+    if ack is not None:
+        phant_inbox[0].ack(user, ack)
+    page = phant_inbox[0].read(user, since, limit, timeout)
+    return {
+        "items": [mail.to_dict(encoding) for _, mail in page],
+        "cursor": page[-1][0] if len(page) > 0 else since,
+    }
+
+
+@endpoint("/users/<user>/inbox/stream", signed=True)
+def inbox_stream(user: str, encoding: str = "base64"):
+    if encoding not in Mail.encodings:
+        return f"Invalid encoding: {encoding}", 422
+
+    def events():
+        cursor = 0
+        while True:
+            page = phant_inbox[0].read(user, cursor, MAX_INBOX_PAGE, STREAM_HEARTBEAT)
+            if len(page) == 0:
+                yield ": heartbeat\n\n"
+            for cursor, mail in page:
+                yield f"id: {cursor}\nevent: mail\ndata: {json.dumps(mail.to_dict(encoding))}\n\n"
+                # The server asked for the next chunk, so this event was written: only now is the mail removed.
+                # A client that disconnects earlier gets it again on its next stream
+                phant_inbox[0].ack(user, cursor)
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @endpoint("/users/<user>/inbox", methods=("POST",), signed=True)
 def inbox_post(user: str):
-    if request.is_json:
-        activity = request.json
-    else:
-        activity = json.loads(request.data.decode())
+    with profiler.stage("json_decode"):
+        activity = _request_activity()
+    if activity is None:
+        return "Invalid activity: expected a JSON object", 422
     recipients = activity.get("to")
     if recipients is None:
         return "Missing field: to", 409
@@ -115,18 +188,53 @@ def inbox_post(user: str):
         recipients = (recipients,)
     elif not isinstance(recipients, list):
         return "Invalid type for field: to", 409
-    mail = Mail(
-        method=request.method,
-        path=request.path,
-        data=request.data,
-        headers=dict(request.headers),
-        content_type=request.content_type,
-    ).to_dict()
+    mail = _request_mail()
     for recipient in recipients:
-        recipient_user = urlparse(recipient).path.split("/")[2]
-        if recipient_user != user:
-            return f"Invalid recipient in field to: {recipient_user}", 409
-        global_inbox[user].append(mail)
+        if not isinstance(recipient, str):
+            continue
+        parts = urlparse(recipient).path.split("/")
+        if len(parts) > 2 and parts[2] == user:
+            break
+    else:
+        return f"Missing recipient in field to: {user}", 409
+    with profiler.stage("storage"):
+        phant_inbox[0].put((user,), mail)
+
+
+@endpoint("/inbox", methods=("POST",), signed=True)
+def shared_inbox_post():
+    with profiler.stage("json_decode"):
+        activity = _request_activity()
+    if activity is None:
+        return "Invalid activity: expected a JSON object", 422
+    users = {}
+    for field in ("to", "cc"):
+        recipients = activity.get(field, [])
+        if isinstance(recipients, str):
+            recipients = (recipients,)
+        elif not isinstance(recipients, list):
+            return f"Invalid type for field: {field}", 409
+        for recipient in recipients:
+            user = _local_user(recipient)
+            if user is not None:
+                users[user] = None
+    if len(users) == 0:
+        return "Missing local recipient in fields to and cc", 409
+    # The signature was verified once for the whole delivery and every inbox shares the same mail
+    with profiler.stage("storage"):
+        phant_inbox[0].put(tuple(users), _request_mail())
+
+
+@endpoint("/metrics")
+def metrics():
+    return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@endpoint("/profile")
+def profile():
+    if not profiler.enabled:
+        return "Profiling Disabled", 404
+    return profiler.summary()
 
 
 @endpoint("robots.txt")
@@ -218,3 +326,45 @@ def mastodon_instance():
 
 def get_phant_id(user: str):
     return f"{phant_instance[0]}/users/{user}"
+
+
+def _request_activity() -> Optional[dict]:
+    # None unless the body is a JSON object
+    if request.is_json:
+        activity = request.get_json(silent=True)
+    else:
+        try:
+            activity = json.loads(request.data)
+        except ValueError:
+            activity = None
+    return activity if isinstance(activity, dict) else None
+
+
+def _request_mail() -> Mail:
+    return Mail(
+        method=request.method,
+        path=request.path,
+        data=request.data,
+        headers=dict(request.headers),
+        content_type=request.content_type,
+    )
+
+
+def _local_user(recipient: Any) -> Optional[str]:
+    # The registry lookup can hit the database, so it only runs for urls of local users
+    if not isinstance(recipient, str):
+        return None
+    try:
+        url = Instance(recipient)
+    except ValueError:
+        return None
+    if url != phant_instance[0]:
+        return None
+    parts = url.path.split("/")
+    if len(parts) != 3 or parts[1] != "users":
+        return None
+    try:
+        server_verifier.get_key(get_phant_id(parts[2]))
+    except KeyError:
+        return None
+    return parts[2]
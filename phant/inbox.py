@@ -0,0 +1,188 @@
+import json
+import sqlite3
+import bisect
+import itertools
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+
+from .datatypes import Mail
+from .sqlite import SqliteConnections
+
+
+class Inbox(ABC):
+    @abstractmethod
+    def put(self, users: Iterable[str], mail: Mail):
+        raise NotImplementedError
+
+    @abstractmethod
+    def take(self, user: str, timeout: float = 0) -> list[Mail]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, user: str, since: int = 0, limit: int = None, timeout: float = 0) -> list[tuple[int, Mail]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def ack(self, user: str, cursor: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def depth(self, user: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def depths(self) -> dict[str, int]:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
+
+
+class MemoryInbox(Inbox):
+    def __init__(self):
+        self._mails: dict[str, list[tuple[int, Mail]]] = defaultdict(list)
+        self._cursors = itertools.count(1)
+        self._condition = threading.Condition()
+
+    def put(self, users: Iterable[str], mail: Mail):
+        with self._condition:
+            for user in users:
+                self._mails[user].append((next(self._cursors), mail))
+            self._condition.notify_all()
+
+    def take(self, user: str, timeout: float = 0) -> list[Mail]:
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._mails.get(user, ())) > 0, timeout)
+            return [mail for _, mail in self._mails.pop(user, ())]
+
+    def read(self, user: str, since: int = 0, limit: int = None, timeout: float = 0) -> list[tuple[int, Mail]]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._index(user, since) < len(self._mails.get(user, ())), timeout)
+            start = self._index(user, since)
+            end = None if limit is None else start + limit
+            return self._mails.get(user, [])[start:end]
+
+    def ack(self, user: str, cursor: int):
+        with self._condition:
+            if user in self._mails:
+                del self._mails[user][:self._index(user, cursor)]
+
+    def _index(self, user: str, cursor: int) -> int:
+        return bisect.bisect_right(self._mails.get(user, ()), cursor, key=lambda entry: entry[0])
+
+    def depth(self, user: str) -> int:
+        return len(self._mails.get(user, ()))
+
+    def depths(self) -> dict[str, int]:
+        with self._condition:
+            return {user: len(mails) for user, mails in self._mails.items() if len(mails) > 0}
+
+
+class SqliteInbox(Inbox):
+    def __init__(self, path: str, poll_interval: float = 0.25):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._connection = SqliteConnections(path)
+        self._condition = threading.Condition()
+        with self._connection() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS mails (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    headers TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    content_type TEXT,
+                    data BLOB NOT NULL
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS inbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user TEXT NOT NULL,
+                    mail INTEGER NOT NULL REFERENCES mails (id)
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS inbox_user ON inbox (user, id)")
+            db.execute("CREATE INDEX IF NOT EXISTS inbox_mail ON inbox (mail)")
+
+    def put(self, users: Iterable[str], mail: Mail):
+        db = self._connection()
+        with db:
+            db.execute("BEGIN")
+            mail_id = db.execute(
+                "INSERT INTO mails (headers, method, path, content_type, data) VALUES (?, ?, ?, ?, ?)",
+                (json.dumps(mail.headers), mail.method, mail.path, mail.content_type, mail.data),
+            ).lastrowid
+            db.executemany("INSERT INTO inbox (user, mail) VALUES (?, ?)", ((user, mail_id) for user in users))
+        with self._condition:
+            self._condition.notify_all()
+
+    def take(self, user: str, timeout: float = 0) -> list[Mail]:
+        return self._wait(lambda: self._take(user), timeout)
+
+    def read(self, user: str, since: int = 0, limit: int = None, timeout: float = 0) -> list[tuple[int, Mail]]:
+        return self._wait(lambda: self._read(user, since, limit), timeout)
+
+    def ack(self, user: str, cursor: int):
+        db = self._connection()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            mail_ids = db.execute("SELECT mail FROM inbox WHERE user = ? AND id <= ?", (user, cursor)).fetchall()
+            db.execute("DELETE FROM inbox WHERE user = ? AND id <= ?", (user, cursor))
+            self._delete_orphans(db, [mail_id for mail_id, in mail_ids])
+
+    def depth(self, user: str) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM inbox WHERE user = ?", (user,)).fetchone()[0]
+
+    def depths(self) -> dict[str, int]:
+        return dict(self._connection().execute("SELECT user, COUNT(*) FROM inbox GROUP BY user").fetchall())
+
+    def _take(self, user: str) -> list[Mail]:
+        db = self._connection()
+        if db.execute("SELECT 1 FROM inbox WHERE user = ? LIMIT 1", (user,)).fetchone() is None:
+            return []
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT inbox.id, mails.id, headers, method, path, content_type, data FROM inbox "
+                "JOIN mails ON mails.id = inbox.mail WHERE user = ? ORDER BY inbox.id",
+                (user,),
+            ).fetchall()
+            if len(rows) == 0:
+                return []
+            db.execute("DELETE FROM inbox WHERE user = ? AND id <= ?", (user, rows[-1][0]))
+            self._delete_orphans(db, [row[1] for row in rows])
+        return [_mail(*row[2:]) for row in rows]
+
+    def _read(self, user: str, since: int, limit: int = None) -> list[tuple[int, Mail]]:
+        rows = self._connection().execute(
+            "SELECT inbox.id, headers, method, path, content_type, data FROM inbox "
+            "JOIN mails ON mails.id = inbox.mail WHERE user = ? AND inbox.id > ? ORDER BY inbox.id LIMIT ?",
+            (user, since, -1 if limit is None else limit),
+        ).fetchall()
+        return [(row[0], _mail(*row[1:])) for row in rows]
+
+    def _wait(self, fetch: Callable[[], list], timeout: float) -> list:
+        deadline = time.monotonic() + timeout
+        while True:
+            items = fetch()
+            remaining = deadline - time.monotonic()
+            if len(items) > 0 or remaining <= 0:
+                return items
+            # Other worker processes can write to the database too, so waits are capped by the poll interval
+            with self._condition:
+                self._condition.wait(min(remaining, self.poll_interval))
+
+    @staticmethod
+    def _delete_orphans(db: sqlite3.Connection, mail_ids: list[int]):
+        db.executemany(
+            "DELETE FROM mails WHERE id = ? AND NOT EXISTS (SELECT 1 FROM inbox WHERE mail = ?)",
+            ((mail_id, mail_id) for mail_id in mail_ids),
+        )
+
+
+def _mail(headers: str, method: str, path: str, content_type: str, data: bytes) -> Mail:
+    return Mail(headers=json.loads(headers), method=method, path=path, content_type=content_type, data=data)
@@ -1,52 +1,104 @@
+from functools import lru_cache
+from typing import NamedTuple
 from urllib.parse import urlparse
 
 
 class Instance:
-    def __init__(
-            self,
+    # Immutable and interned: parsing the same url again returns the same object
+    __slots__ = ("scheme", "hostname", "port", "path", "url")
+
+    def __new__(
+            cls,
             url: str,
             default_scheme: str = "https"
     ):
-        parsed = urlparse(url)
-        if parsed.hostname is None:
-            if parsed.scheme == "":
-                parts = parsed.path.split("/")
-                sub = parts[0].split(":")
-                self.hostname = sub[0]
-                self.port = int(sub[1]) if len(sub) > 1 else None
-                self.path = "/" + "/".join(parts[1:])
-            else:
-                self.hostname = parsed.scheme
-                parts = parsed.path.split("/")
-                self.port = int(parts[0])
-                self.path = "/" + "/".join(parts[1:])
-            if self.hostname == "127.0.0.1":
-                self.scheme = "http"
-            elif self.port == 80:
-                self.scheme = "http"
-            elif self.port == 443:
-                self.scheme = "https"
-            else:
-                self.scheme = default_scheme
-        else:
-            self.scheme = parsed.scheme
-            self.hostname = parsed.hostname
-            self.port = parsed.port
-            self.path = parsed.path or "/"
-        if self.port is None:
-            self.url = f"{self.scheme}://{self.hostname}"
-        else:
-            self.url = f"{self.scheme}://{self.hostname}:{self.port}"
+        return _parse_instance(url, default_scheme)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __reduce__(self):
+        return Instance, (f"{self.url}{self.path}",)
 
     def __str__(self):
         return self.url
 
     def __eq__(self, other: 'Instance'):
-        return all([
-            self.scheme == other.scheme,
-            self.hostname == other.hostname,
-            self.port == other.port,
-        ])
+        if not isinstance(other, Instance):
+            return NotImplemented
+        return self is other or (
+            self.scheme == other.scheme
+            and self.hostname == other.hostname
+            and self.port == other.port
+        )
+
+    def __hash__(self):
+        return hash((self.scheme, self.hostname, self.port))
 
     def __repr__(self):
         return f"<{self.__class__.__name__} {self}>"
+
+
+class EndpointUrl(NamedTuple):
+    instance: Instance
+    path: str
+
+    @staticmethod
+    def parse(url: str) -> 'EndpointUrl':
+        return _parse_endpoint(url)
+
+    @property
+    def hostname(self) -> str:
+        return self.instance.hostname
+
+    def __str__(self):
+        return f"{self.instance}{self.path}"
+
+
+@lru_cache(maxsize=4096)
+def _parse_instance(url: str, default_scheme: str) -> Instance:
+    parsed = urlparse(url)
+    if parsed.hostname is None:
+        if parsed.scheme == "":
+            parts = parsed.path.split("/")
+            sub = parts[0].split(":")
+            hostname = sub[0]
+            port = int(sub[1]) if len(sub) > 1 else None
+            path = "/" + "/".join(parts[1:])
+        else:
+            hostname = parsed.scheme
+            parts = parsed.path.split("/")
+            port = int(parts[0])
+            path = "/" + "/".join(parts[1:])
+        if hostname == "127.0.0.1":
+            scheme = "http"
+        elif port == 80:
+            scheme = "http"
+        elif port == 443:
+            scheme = "https"
+        else:
+            scheme = default_scheme
+    else:
+        scheme = parsed.scheme
+        hostname = parsed.hostname
+        port = parsed.port
+        path = parsed.path or "/"
+    instance = object.__new__(Instance)
+    for name, value in (
+            ("scheme", scheme),
+            ("hostname", hostname),
+            ("port", port),
+            ("path", path),
+            ("url", f"{scheme}://{hostname}" if port is None else f"{scheme}://{hostname}:{port}"),
+    ):
+        object.__setattr__(instance, name, value)
+    return instance
+
+
+@lru_cache(maxsize=4096)
+def _parse_endpoint(url: str) -> EndpointUrl:
+    instance = Instance(url)
+    return EndpointUrl(instance, instance.path)
@@ -0,0 +1,77 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from .sqlite import SqliteConnections
+
+
+class KeyRegistry(ABC):
+    # Public keys by keyId, stored as PEM so every process can import them
+    @abstractmethod
+    def get(self, key_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key_id: str, pem: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key_id: str):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
+
+
+class MemoryKeyRegistry(KeyRegistry):
+    def __init__(self):
+        self._pems: dict[str, str] = {}
+
+    def get(self, key_id: str) -> Optional[str]:
+        return self._pems.get(key_id)
+
+    def set(self, key_id: str, pem: str):
+        self._pems[key_id] = pem
+
+    def delete(self, key_id: str):
+        self._pems.pop(key_id, None)
+
+    def __len__(self):
+        return len(self._pems)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self)}>"
+
+
+class SqliteKeyRegistry(KeyRegistry):
+    # Shared by every worker process using the same path
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = SqliteConnections(path)
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS keys (
+                id TEXT PRIMARY KEY,
+                pem TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def get(self, key_id: str) -> Optional[str]:
+        row = self._connection().execute("SELECT pem FROM keys WHERE id = ?", (key_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key_id: str, pem: str):
+        self._connection().execute(
+            "INSERT INTO keys (id, pem, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET pem = excluded.pem, updated = excluded.updated",
+            (key_id, pem, time.time()),
+        )
+
+    def delete(self, key_id: str):
+        self._connection().execute("DELETE FROM keys WHERE id = ?", (key_id,))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.path}>"
@@ -1,30 +1,208 @@
+import atexit
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque
+from collections.abc import Callable, Hashable
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.pool import AsyncResult
 from pathlib import Path
+from typing import Union
 
-from Crypto.PublicKey import RSA
+from Crypto.PublicKey import ECC, RSA
+from Crypto.PublicKey.ECC import EccKey
+from Crypto.PublicKey.RSA import RsaKey
+
+Key = Union[RsaKey, EccKey]
+
+DEFAULT_KEY_BITS = 3072
+# The smallest size pycryptodome generates, much faster and only meant for tests
+TEST_KEY_BITS = 1024
+RSA_KEY = "rsa"
+# Signed with hs2019, much faster than RSA but only understood by some servers
+ED25519_KEY = "ed25519"
+
+
+class KeyPool:
+    # Keeps `size` key pairs generating or ready in background processes, so taking one rarely waits. The workers
+    # are daemon processes: close() and interpreter exit stop them without waiting for keys still generating
+    def __init__(
+            self,
+            size: int = 16,
+            bits: int = DEFAULT_KEY_BITS,
+            workers: int = None,
+            key_type: str = RSA_KEY,
+    ):
+        self.size = size
+        self.bits = bits
+        self.key_type = key_type
+        self._pool = multiprocessing.Pool(workers)
+        self._results: deque[AsyncResult] = deque()
+        self._lock = threading.Lock()
+        self.fill()
+
+    def fill(self):
+        with self._lock:
+            while len(self._results) < self.size:
+                self._results.append(self._pool.apply_async(_generate_pem, (self.bits, self.key_type)))
+
+    def take(self) -> tuple[str, str]:
+        with self._lock:
+            result = self._results.popleft() if self._results else None
+        self.fill()
+        return result.get() if result is not None else _generate_pem(self.bits, self.key_type)
+
+    def close(self):
+        with self._lock:
+            self._results.clear()
+        self._pool.terminate()
+
+    def __len__(self):
+        return sum(result.ready() for result in list(self._results))
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self)}/{self.size} ready, {self.key_type}>"
+
+
+_default_key_pool: KeyPool = None
+_default_key_pool_lock = threading.Lock()
+
+
+def take_key_pair(pool: KeyPool = None) -> tuple[str, str]:
+    global _default_key_pool
+    if pool is None:
+        with _default_key_pool_lock:
+            if _default_key_pool is None:
+                # One key in flight per CPU, and closed at exit
+                _default_key_pool = KeyPool(os.cpu_count() or 1)
+                atexit.register(_default_key_pool.close)
+        pool = _default_key_pool
+    return pool.take()
 
 
 def generate_keys(
         private_key_path: str,
-        public_key_path: str
+        public_key_path: str,
+        bits: int = DEFAULT_KEY_BITS,
+        pool: KeyPool = None,
+        key_type: str = RSA_KEY,
 ):
     private_key_path = Path(private_key_path)
     public_key_path = Path(public_key_path)
     if private_key_path.exists() or public_key_path.exists():
         raise FileExistsError
-    key_pair = RSA.generate(3072)
-    private_key = key_pair.export_key().decode("ascii")
-    public_key = key_pair.public_key().export_key().decode("ascii")
+    private_key, public_key = pool.take() if pool is not None else _generate_pem(bits, key_type)
+    _write_key_pair(private_key, public_key, private_key_path, public_key_path)
+
+
+def generate_keys_many(
+        n: int,
+        directory: str,
+        bits: int = DEFAULT_KEY_BITS,
+        prefix: str = "key",
+        workers: int = None,
+        key_type: str = RSA_KEY,
+) -> list[tuple[Path, Path]]:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = [(directory / f"{prefix}{index}.pem", directory / f"{prefix}{index}.pub") for index in range(n)]
+    if any(private_key_path.exists() or public_key_path.exists() for private_key_path, public_key_path in paths):
+        raise FileExistsError
+    with ProcessPoolExecutor(workers) as executor:
+        for (private_key, public_key), (private_key_path, public_key_path) in zip(
+                executor.map(_generate_pem, [bits] * n, [key_type] * n), paths
+        ):
+            _write_key_pair(private_key, public_key, private_key_path, public_key_path)
+    return paths
+
+
+def export_key_pem(key: Key) -> str:
+    pem = key.export_key(format="PEM")
+    return pem.decode("ascii") if isinstance(pem, bytes) else pem
+
+
+def same_key(key: Key, other: Key) -> bool:
+    return type(key) is type(other) and key == other
+
+
+def _generate_pem(bits: int, key_type: str = RSA_KEY) -> tuple[str, str]:
+    if key_type == RSA_KEY:
+        key_pair = RSA.generate(bits)
+    elif key_type == ED25519_KEY:
+        key_pair = ECC.generate(curve="ed25519")
+    else:
+        raise ValueError(f"Unknown key type: {key_type}")
+    return export_key_pem(key_pair), export_key_pem(key_pair.public_key())
+
+
+def _parse_key(key_pem: str) -> Key:
+    try:
+        return RSA.import_key(key_pem)
+    except ValueError:
+        key = ECC.import_key(key_pem)
+    # Other curves import fine but can't sign or verify hs2019 signatures
+    if key.curve != "Ed25519":
+        raise ValueError(f"Unsupported curve: {key.curve}")
+    return key
+
+
+def _write_key_pair(private_key: str, public_key: str, private_key_path: Path, public_key_path: Path):
     with open(private_key_path, "w") as fp:
         fp.write(private_key)
     with open(public_key_path, "w") as fp:
         fp.write(public_key)
 
 
+class KeyCache:
+    # Parsed keys by PEM hash or by (path, mtime), so the same PEM is only decoded once
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, Key] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, load: Callable[[], Key]) -> Key:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = load()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self), "max_size": self.max_size}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self)}/{self.max_size}>"
+
+
+key_cache = KeyCache()
+
+
 def load_key(key_path: str = None):
     if key_path is None:
         return None
-    with open(key_path) as fp:
-        return RSA.import_key(fp.read())
+    stat = os.stat(key_path)
+    return key_cache.get(
+        ("path", os.path.abspath(key_path), stat.st_mtime_ns, stat.st_size),
+        lambda: _parse_key(load_key_pem(key_path)),
+    )
 
 
 def load_key_pem(key_path: str = None):
@@ -38,4 +216,4 @@ def import_key(key_pem: str = None):
     if key_pem is None or key_pem == "":
         return None
     else:
-        return RSA.import_key(key_pem)
+        return key_cache.get(("pem", hashlib.sha256(key_pem.encode()).digest()), lambda: _parse_key(key_pem))
@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import request
+
+
+class AccessLog:
+    def __init__(self, logger: logging.Logger, sample_rate: float = 1.0):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self._handlers: tuple[logging.Handler, ...] = ()
+        self._queue_handler = None
+        self._listener = None
+        self._fork_hook = False
+
+    def record(self, endpoint: str, status: int, latency: float, message: str):
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        # Errors are always logged, successful requests only at the sample rate
+        if status < 400 and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self.logger.info(
+            "%s %s %s %.1fms - %s",
+            request.method, request.path, status, latency * 1000, message,
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "endpoint": endpoint,
+                "status": status,
+                "latency": latency,
+            },
+        )
+
+    def start(self, *handlers: logging.Handler):
+        if self._listener is not None:
+            return
+        self._handlers = handlers
+        self._start()
+        if hasattr(os, "register_at_fork") and not self._fork_hook:
+            os.register_at_fork(after_in_child=self._after_fork)
+            self._fork_hook = True
+
+    def stop(self):
+        if self._listener is None:
+            return
+        self._listener.stop()
+        self.logger.removeHandler(self._queue_handler)
+        self._listener = self._queue_handler = None
+
+    def _start(self):
+        records = queue.SimpleQueue()
+        self._queue_handler = QueueHandler(records)
+        self._listener = QueueListener(records, *self._handlers, respect_handler_level=True)
+        self.logger.addHandler(self._queue_handler)
+        self.logger.propagate = False
+        self._listener.start()
+
+    def _after_fork(self):
+        # The writer thread doesn't survive a fork (e.g. gunicorn --preload), so every child starts its own
+        if self._listener is None:
+            return
+        self.logger.removeHandler(self._queue_handler)
+        self._start()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.logger.name}>"
+
+
+class JsonFormatter(logging.Formatter):
+    fields = ("method", "path", "endpoint", "status", "latency")
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(dict(
+            {field: getattr(record, field) for field in self.fields if hasattr(record, field)},
+            time=record.created,
+            logger=record.name,
+            level=record.levelname,
+            message=record.getMessage(),
+        ))
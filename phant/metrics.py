@@ -0,0 +1,159 @@
+import bisect
+import itertools
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SHARDS = 16
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, names, values, value in self.samples():
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+            lines.append(f"{self.name}{suffix}{{{label_text}}} {value}" if label_text else f"{self.name}{suffix} {value}")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name}>"
+
+
+class _Sharded(Metric):
+    # Threads are spread over a fixed number of shards, each with its own lock, so writers rarely contend and
+    # thread-per-request servers don't grow the metric; shards are merged when scraped
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._local = threading.local()
+        self._shards: list[tuple[threading.Lock, dict]] = [(threading.Lock(), {}) for _ in range(SHARDS)]
+        self._next_shard = itertools.count()
+
+    def _shard(self) -> tuple[threading.Lock, dict]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = self._shards[next(self._next_shard) % SHARDS]
+        return shard
+
+    def _merged(self, size: int) -> dict[tuple[str, ...], list[float]]:
+        merged = defaultdict(lambda: [0] * size)
+        for lock, shard in self._shards:
+            with lock:
+                for labels, series in shard.items():
+                    total = merged[labels]
+                    for index, value in enumerate(series):
+                        total[index] += value
+        return merged
+
+
+class Counter(_Sharded):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        lock, shard = self._shard()
+        with lock:
+            series = shard.get(labels)
+            if series is None:
+                series = shard[labels] = [0]
+            series[0] += amount
+
+    def samples(self):
+        for labels, series in sorted(self._merged(1).items()):
+            yield "", self.labels, labels, series[0]
+
+
+class Histogram(_Sharded):
+    type = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            help: str,
+            labels: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        lock, shard = self._shard()
+        with lock:
+            series = shard.get(labels)
+            if series is None:
+                # One slot per bucket, one for +Inf and one for the sum
+                series = shard[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        for labels, series in sorted(self._merged(len(self.buckets) + 2).items()):
+            count = 0
+            for bound, bucket in zip((*self.buckets, "+Inf"), series):
+                count += bucket
+                yield "_bucket", (*self.labels, "le"), (*labels, str(bound)), count
+            yield "_sum", self.labels, labels, series[-1]
+            yield "_count", self.labels, labels, count
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(
+            self,
+            name: str,
+            help: str,
+            labels: tuple[str, ...] = (),
+            callback: Callable[[], dict[tuple[str, ...], float]] = None,
+    ):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def samples(self):
+        if self.callback is None:
+            return
+        for labels, value in sorted(self.callback().items()):
+            yield "", self.labels, labels, value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registry = Registry()
+request_latency = registry.register(Histogram(
+    "phant_request_duration_seconds", "Time spent handling requests.", ("route", "method")
+))
+requests_total = registry.register(Counter(
+    "phant_requests_total", "Handled requests.", ("route", "method", "status")
+))
+verify_latency = registry.register(Histogram(
+    "phant_signature_verify_duration_seconds", "Time spent verifying HTTP signatures."
+))
+outbound_latency = registry.register(Histogram(
+    "phant_outbound_request_duration_seconds", "Time spent on signed outbound requests.", ("method", "status")
+))
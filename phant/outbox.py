@@ -0,0 +1,232 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Union
+
+from .actor import Actor
+from .auth import signed_request
+from .instance import Instance
+from .transport import Transport
+
+
+class Outbox:
+    def __init__(
+            self,
+            path: str,
+            workers: int = 4,
+            max_attempts: int = 10,
+            backoff: float = 1,
+            max_backoff: float = 3600,
+            lease: float = 300,
+            poll_interval: float = 5,
+            transport: Transport = None,
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.transport = transport
+        self.delivered = 0
+        self.retries = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._senders: dict[str, Actor] = {}
+        self._threads: list[threading.Thread] = []
+        self._running = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created REAL NOT NULL,
+                next_attempt REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                dead INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (dead, next_attempt)")
+        # What is needed to rebuild a sender after a restart. The private key itself stays in its file
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS senders (
+                id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                instance TEXT NOT NULL,
+                actor TEXT NOT NULL,
+                private_key_path TEXT NOT NULL
+            )
+        """)
+
+    def register_sender(self, sender: Actor):
+        # Senders loaded from a private key file are saved by enqueue and rebuilt after a restart, others have to
+        # be registered again at startup before their pending jobs are delivered
+        with self._wakeup:
+            self._remember(sender)
+            self._wakeup.notify_all()
+
+    def enqueue(self, content: Union[str, bytes], sender: Actor, endpoint: str):
+        now = time.time()
+        with self._wakeup:
+            self._remember(sender)
+            self._db.execute(
+                "INSERT INTO outbox (sender, endpoint, content, created, next_attempt) VALUES (?, ?, ?, ?, ?)",
+                (sender.public_key_id, endpoint, content, now, now),
+            )
+            self._wakeup.notify()
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._wakeup:
+            self._running = False
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox WHERE dead = 0").fetchone()[0]
+
+    def dead_letters(self) -> list[tuple[int, str, str]]:
+        with self._lock:
+            return self._db.execute("SELECT id, endpoint, last_error FROM outbox WHERE dead = 1").fetchall()
+
+    def requeue_dead(self):
+        with self._wakeup:
+            self._db.execute("UPDATE outbox SET dead = 0, attempts = 0, next_attempt = ? WHERE dead = 1", (time.time(),))
+            self._wakeup.notify_all()
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            depth, dead = self._db.execute(
+                "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0) FROM outbox"
+            ).fetchone()
+            return {
+                "depth": depth,
+                "dead": dead,
+                "delivered": self.delivered,
+                "retries": self.retries,
+                "latency_avg": self.latency_total / self.delivered if self.delivered else 0.0,
+                "latency_max": self.latency_max,
+            }
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                return
+            id, sender_id, endpoint, content, created, attempts = job
+            try:
+                sender = self._sender(sender_id)
+                response = signed_request(
+                    method="POST",
+                    endpoint=endpoint,
+                    content=content,
+                    sender=sender,
+                    transport=self.transport,
+                )
+            except Exception as e:
+                self._fail(id, attempts, repr(e))
+                continue
+            if response.status_code // 100 == 2:
+                self._done(id, created)
+            elif response.status_code == 429 or response.status_code // 100 == 5:
+                self._fail(id, attempts, f"HTTP {response.status_code}", _retry_after(response))
+            else:
+                self._fail(id, attempts, f"HTTP {response.status_code}", permanent=True)
+
+    def _claim(self):
+        with self._wakeup:
+            while self._running:
+                now = time.time()
+                senders = list(self._senders)
+                row = self._db.execute(
+                    f"SELECT id, sender, endpoint, content, created, attempts, next_attempt FROM outbox "
+                    f"WHERE dead = 0 AND (sender IN ({', '.join('?' * len(senders))}) "
+                    f"OR sender IN (SELECT id FROM senders)) "
+                    f"ORDER BY next_attempt LIMIT 1",
+                    senders,
+                ).fetchone()
+                if row is None or row[6] > now:
+                    self._wakeup.wait(self.poll_interval if row is None else min(row[6] - now, self.poll_interval))
+                    continue
+                # Other processes may share the database, so the lease is taken with a compare-and-set
+                claimed = self._db.execute(
+                    "UPDATE outbox SET next_attempt = ? WHERE id = ? AND next_attempt = ?",
+                    (now + self.lease, row[0], row[6]),
+                ).rowcount
+                if claimed:
+                    return row[:6]
+        return None
+
+    def _remember(self, sender: Actor):
+        if self._senders.get(sender.public_key_id) is sender:
+            return
+        self._senders[sender.public_key_id] = sender
+        if sender.private_key_path is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO senders (id, username, instance, actor, private_key_path) VALUES (?, ?, ?, ?, ?)",
+                (sender.public_key_id, sender.username, str(sender.instance), json.dumps(sender.json),
+                 str(sender.private_key_path)),
+            )
+
+    def _sender(self, sender_id: str) -> Actor:
+        with self._lock:
+            sender = self._senders.get(sender_id)
+            if sender is None:
+                row = self._db.execute(
+                    "SELECT username, instance, actor, private_key_path FROM senders WHERE id = ?", (sender_id,)
+                ).fetchone()
+                if row is None:
+                    raise KeyError(sender_id)
+                username, instance, actor, private_key_path = row
+                sender = Actor(username, Instance(instance), private_key_path, **json.loads(actor))
+                self._senders[sender_id] = sender
+            return sender
+
+    def _done(self, id: int, created: float):
+        latency = time.time() - created
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (id,))
+            self.delivered += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def _fail(self, id: int, attempts: int, error: str, retry_after: float = 0, permanent: bool = False):
+        attempts += 1
+        dead = permanent or attempts >= self.max_attempts
+        delay = max(min(self.backoff * 2 ** attempts, self.max_backoff), retry_after)
+        with self._wakeup:
+            self._db.execute(
+                "UPDATE outbox SET attempts = ?, last_error = ?, next_attempt = ?, dead = ? WHERE id = ?",
+                (attempts, error, time.time() + delay, dead, id),
+            )
+            self.retries += not dead
+            self._wakeup.notify()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
+
+
+def _retry_after(response) -> float:
+    try:
+        return float(response.headers.get("Retry-After", 0))
+    except ValueError:
+        return 0
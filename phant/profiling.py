@@ -0,0 +1,93 @@
+import cProfile
+import logging
+import time
+from pathlib import Path
+
+from .metrics import Histogram, registry
+
+PROFILE_HEADER = "X-Phant-Profile"
+STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 1)
+
+stage_latency = registry.register(Histogram(
+    "phant_stage_duration_seconds", "Time spent in each profiled stage of request handling.", ("stage",), STAGE_BUCKETS
+))
+logger = logging.getLogger("Profiler")
+
+
+class Profiler:
+    # Disabled by default so the hot paths only pay for an attribute lookup
+    def __init__(self, enabled: bool = False, profile_dir: str = None):
+        self.enabled = enabled
+        self.profile_dir = profile_dir
+
+    def stage(self, name: str):
+        return _Stage(name) if self.enabled else _NO_STAGE
+
+    def capture(self, name: str, requested: bool):
+        # cProfile is scoped to a single request that asks for it with the profile header
+        if not self.enabled or not requested or self.profile_dir is None:
+            return _NO_STAGE
+        return _Capture(Path(self.profile_dir) / f"{time.time_ns()}-{name}.prof")
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        summary = {}
+        for suffix, _, labels, value in stage_latency.samples():
+            if suffix in ("_sum", "_count"):
+                summary.setdefault(labels[0], {})[suffix[1:]] = value
+        for stage in summary.values():
+            stage["mean"] = stage["sum"] / stage["count"] if stage.get("count") else 0
+        return summary
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {'enabled' if self.enabled else 'disabled'}>"
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stage_latency.observe(time.perf_counter() - self.start, self.name)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _Capture:
+    def __init__(self, path: Path):
+        self.path = path
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Another profiler is already running on this interpreter
+            self.profile = None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is None:
+            return
+        self.profile.disable()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.profile.dump_stats(self.path)
+        logger.info("Wrote request profile to %s", self.path)
+
+
+_NO_STAGE = _NoStage()
+profiler = Profiler()
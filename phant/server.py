@@ -1,17 +1,27 @@
 import inspect
 import json
 import logging
+import time
 from collections.abc import Callable
+from typing import Any, Optional
 from uuid import uuid4
 
 from flask import Flask, request
 
 from .auth import RequestsVerifier
+from .inbox import Inbox, MemoryInbox
 from .instance import Instance
+from .key_registry import KeyRegistry
+from .logs import AccessLog
+from .metrics import request_latency, requests_total
+from .profiling import PROFILE_HEADER, profiler
+from .wsgi import MAX_BODY_SIZE, BodyDigestMiddleware
 
 phant_instance: list[Instance] = []
+phant_inbox: list[Inbox] = []
 server_verifier = RequestsVerifier()
 logger = logging.getLogger("Server")
+access_log = AccessLog(logger)
 endpoints: list[tuple[str, tuple[str], Callable]] = []
 
 
@@ -20,30 +30,47 @@ def endpoint(
         methods: tuple[str, ...] = ("GET",),
         signed: bool = False,
 ):
+    if not url.startswith("/"):
+        url = f"/{url}"
+
     def decorator(callback):
         def wrapper(**kwargs):
+            start = time.perf_counter()
+            # Set up front so the finally block can record BaseExceptions (e.g. SystemExit) that skip the handler
+            response, message = None, ""
+            try:
+                with profiler.capture(callback.__name__, PROFILE_HEADER in request.headers):
+                    response, message = handle(kwargs)
+            except Exception as e:
+                response, message = None, repr(e)
+                raise
+            finally:
+                latency = time.perf_counter() - start
+                status = 500 if response is None else response[1] if isinstance(response, tuple) else 200
+                access_log.record(url, status, latency, message)
+                request_latency.observe(latency, url, request.method)
+                requests_total.inc(url, request.method, str(status))
+            return response
+
+        def handle(kwargs: dict[str, Any]):
             if signed:
                 error = server_verifier.verify(phant_instance[0], request)
                 if error is not None:
-                    log(error[0])
-                    return error
-            kwargs = dict(request.values, **kwargs)
-            for name, param in parameters.items():
-                if name not in kwargs and param.default is param.empty:
-                    log(f"Missing parameter '{name}'.")
-                    return f"Missing parameter '{name}'.", 422
-                elif not isinstance(kwargs[name], param.annotation):
-                    log(f"Parameter '{name}' should be of type {param.annotation}.")
-                    return f"Parameter '{name}' should be of type {param.annotation}.", 422
+                    return error, error[0]
+            if validate is not None:
+                error = validate(kwargs)
+                if error is not None:
+                    return (error, 422), error
             response = callback(**kwargs)
             if response is None:
                 response = ""
             elif isinstance(response, bool):
                 response = json.dumps(response)
-            log("OK")
-            return response
+            elif isinstance(response, tuple) and isinstance(response[1], int) and response[1] >= 400:
+                return response, str(response[0])
+            return response, "OK"
 
-        parameters = inspect.signature(callback).parameters
+        validate = compile_validator(callback)
         endpoints.append((url, methods, wrapper))
         endpoints.append((f"{url}/", methods, wrapper))
         return callback
@@ -51,8 +78,47 @@ def endpoint(
     return decorator
 
 
-def wrap_flask_app(instance: str, app: Flask):
+def compile_validator(callback: Callable) -> Optional[Callable[[dict[str, Any]], Optional[str]]]:
+    parameters = inspect.signature(callback).parameters.values()
+    if len(parameters) == 0:
+        return None
+    checks = tuple(
+        (
+            param.name,
+            param.default is param.empty,
+            None if param.annotation is param.empty else param.annotation,
+        )
+        for param in parameters
+    )
+
+    def validate(kwargs: dict[str, Any]) -> Optional[str]:
+        values = request.values
+        for name, required, annotation in checks:
+            if name not in kwargs:
+                if name in values:
+                    kwargs[name] = values[name]
+                elif required:
+                    return f"Missing parameter '{name}'."
+                else:
+                    continue
+            if annotation is not None and not isinstance(kwargs[name], annotation):
+                return f"Parameter '{name}' should be of type {annotation}."
+
+    return validate
+
+
+def wrap_flask_app(
+        instance: str,
+        app: Flask,
+        inbox: Inbox = None,
+        max_body_size: int = MAX_BODY_SIZE,
+        key_registry: KeyRegistry = None,
+):
     phant_instance.append(Instance(instance))
+    phant_inbox.append(inbox or MemoryInbox())
+    if key_registry is not None:
+        server_verifier.registry = key_registry
+    app.wsgi_app = BodyDigestMiddleware(app.wsgi_app, max_body_size)
 
     for url, methods, callback in endpoints:
         app.add_url_rule(url, f"{url}-{methods}-{uuid4()}", view_func=callback, methods=methods)
@@ -60,9 +126,5 @@ def wrap_flask_app(instance: str, app: Flask):
     @app.route('/', defaults={'path': '/'}, methods=["GET", "POST"])
     @app.route('/<path:path>', methods=["GET", "POST"])
     def root(path: str):
-        log(f"NOT IMPLEMENTED - {path}")
+        access_log.record("/<path:path>", 501, 0.0, "NOT IMPLEMENTED")
         return "Not implemented", 501
-
-
-def log(message: str):
-    logger.info(f"{request.method} {request.path} {dict(request.values)} - {message}")
@@ -0,0 +1,23 @@
+import os
+import sqlite3
+import threading
+
+
+class SqliteConnections:
+    # Connections are per thread and are reopened after a fork (e.g. gunicorn --preload). Calling returns the
+    # current thread's connection, in autocommit mode and with WAL so readers don't block the writer
+    def __init__(self, path: str, timeout: float = 30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self) -> sqlite3.Connection:
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.db.execute("PRAGMA journal_mode=WAL")
+            self._local.db.execute("PRAGMA synchronous=NORMAL")
+            self._local.pid = os.getpid()
+        return self._local.db
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.path}>"
@@ -0,0 +1,193 @@
+import datetime
+from collections.abc import Iterable
+from typing import Any
+from uuid import uuid4
+
+from .actor import Actor
+from .serialization import dumps
+
+CONTEXT = [
+    "https://www.w3.org/ns/activitystreams",
+    {
+        "ostatus": "http://ostatus.org#",
+        "atomUri": "ostatus:atomUri",
+        "inReplyToAtomUri": "ostatus:inReplyToAtomUri",
+        "conversation": "ostatus:conversation",
+        "sensitive": "as:sensitive",
+        "toot": "http://joinmastodon.org/ns#",
+        "votersCount": "toot:votersCount"
+    }
+]
+
+
+class Field:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name}>"
+
+
+class ActivityTemplate:
+    # The template is serialized once with markers in place of its Fields, rendering only encodes the fields
+    def __init__(self, template: dict[str, Any]):
+        markers = {}
+        serialized = dumps(_mark(template, markers))
+        self.segments: list[bytes] = []
+        self.fields: list[str] = []
+        position = 0
+        while True:
+            start = serialized.find(b'"\\u0000', position)
+            if start < 0:
+                break
+            end = serialized.index(b'"', start + 1) + 1
+            self.segments.append(serialized[position:start])
+            self.fields.append(markers[serialized[start:end]])
+            position = end
+        self.segments.append(serialized[position:])
+
+    def render(self, **values: Any) -> bytes:
+        return self.render_encoded({}, **values)
+
+    def render_encoded(self, encoded: dict[str, bytes], **values: Any) -> bytes:
+        # Fields in `encoded` are already serialized, the others are taken from `values`
+        parts = [self.segments[0]]
+        local = {}
+        for field, segment in zip(self.fields, self.segments[1:]):
+            value = encoded.get(field)
+            if value is None:
+                value = local.get(field)
+                if value is None:
+                    value = local[field] = dumps(values[field])
+            parts.append(value)
+            parts.append(segment)
+        return b"".join(parts)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {', '.join(dict.fromkeys(self.fields))}>"
+
+
+def render_note(
+        content: str,
+        sender: Actor,
+        recipients: list[Actor],
+        date: datetime.datetime,
+        summary: str = None,
+        in_reply_to: str = None,
+        in_reply_to_atom_uri: str = None,
+        sensitive: bool = False,
+) -> bytes:
+    return render_notes(
+        [content], sender, recipients, date, summary, in_reply_to, in_reply_to_atom_uri, sensitive
+    )[0]
+
+
+def render_notes(
+        contents: Iterable[str],
+        sender: Actor,
+        recipients: list[Actor],
+        date: datetime.datetime = None,
+        summary: str = None,
+        in_reply_to: str = None,
+        in_reply_to_atom_uri: str = None,
+        sensitive: bool = False,
+) -> list[bytes]:
+    date = date or datetime.datetime.now()
+    # Everything but the ids and the content is shared by the batch, so it is only encoded once
+    shared = {
+        "actor": dumps(sender.id),
+        "published": dumps(date.strftime("%Y-%m-%dT%H:%M:%SZ")),
+        "to": dumps([recipient.id for recipient in recipients]),
+        "summary": dumps(summary),
+        "in_reply_to": dumps(in_reply_to),
+        "in_reply_to_atom_uri": dumps(in_reply_to_atom_uri),
+        "sensitive": dumps(sensitive),
+        "tag": dumps([
+            {"type": "Mention", "href": recipient.id, "name": recipient.full_username}
+            for recipient in recipients
+        ]),
+    }
+    conversation_prefix = f"tag:{sender.instance},{date.strftime('%Y-%m-%d')}:objectId="
+    notes = []
+    for content in contents:
+        id_convo = uuid4().fields[0]
+        notes.append(CREATE_NOTE.render_encoded(
+            shared,
+            create_id=f"{sender.id}/{uuid4().fields[0]}",
+            id=f"{sender.id}/{id_convo}",
+            conversation=f"{conversation_prefix}{id_convo}:objectType=Conversation",
+            content=content,
+        ))
+    return notes
+
+
+def fill(layout: Any, **values: Any) -> Any:
+    # A copy of the layout with the given Fields replaced, the others are kept. The values are used as they are
+    return _fill(layout, values)
+
+
+def _fill(layout: Any, values: dict[str, Any]) -> Any:
+    if isinstance(layout, Field):
+        return values.get(layout.name, layout)
+    elif isinstance(layout, dict):
+        return {key: _fill(item, values) for key, item in layout.items()}
+    elif isinstance(layout, list):
+        return [_fill(item, values) for item in layout]
+    return layout
+
+
+def _mark(value: Any, markers: dict[bytes, str]) -> Any:
+    if isinstance(value, Field):
+        marker = f"\0{value.name}"
+        markers[dumps(marker)] = value.name
+        return marker
+    elif isinstance(value, dict):
+        return {key: _mark(item, markers) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [_mark(item, markers) for item in value]
+    return value
+
+
+# The only definitions of the Create and Note layouts: build_create/build_note fill them, CREATE_NOTE renders both
+CREATE = {
+    "@context": CONTEXT,
+    "id": Field("create_id"),
+    "type": "Create",
+    "actor": Field("actor"),
+    "published": Field("published"),
+    "to": Field("to"),
+    "cc": [],
+    "object": Field("object"),
+}
+NOTE = {
+    "id": Field("id"),
+    "type": "Note",
+    "summary": Field("summary"),
+    "inReplyTo": Field("in_reply_to"),
+    "published": Field("published"),
+    "url": Field("id"),
+    "attributedTo": Field("actor"),
+    "to": Field("to"),
+    "cc": [],
+    "sensitive": Field("sensitive"),
+    "atomUri": Field("id"),
+    "inReplyToAtomUri": Field("in_reply_to_atom_uri"),
+    "conversation": Field("conversation"),
+    "content": Field("content"),
+    "contentMap": {},
+    "attachment": [],
+    "tag": Field("tag"),
+    "replies": {
+        "id": Field("id"),
+        "type": "Collection",
+        "first": {
+            "type": "CollectionPage",
+            "next": Field("id"),
+            "partOf": Field("id"),
+            "items": []
+        }
+    }
+}
+CREATE_NOTE = ActivityTemplate(fill(CREATE, object=NOTE))
@@ -0,0 +1,57 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+
+class Transport:
+    def __init__(
+            self,
+            pool_connections: int = 16,
+            pool_maxsize: int = 16,
+            host_pool_maxsize: dict[str, int] = None,
+            connect_timeout: float = 5,
+            read_timeout: float = 30,
+            retries: int = 3,
+            backoff_factor: float = 0.5,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            # Once retries run out the last 5xx response is returned to the caller instead of a RetryError
+            raise_on_status=False,
+        )
+        self._pool_connections = pool_connections
+        self.session = requests.Session()
+        self.session.mount("http://", self._adapter(pool_maxsize))
+        self.session.mount("https://", self._adapter(pool_maxsize))
+        for host, maxsize in (host_pool_maxsize or {}).items():
+            self.session.mount(host, self._adapter(maxsize))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, data=None, **kwargs) -> requests.Response:
+        return self.request("POST", url, data=data, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def _adapter(self, pool_maxsize: int):
+        return HTTPAdapter(
+            pool_connections=self._pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=self._retry,
+        )
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
+
+
+default_transport = Transport()
@@ -0,0 +1,75 @@
+import base64
+import hashlib
+from collections.abc import Callable
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+BODY_DIGEST = "phant.body_digest"
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class DigestingInput:
+    # Hashes the request body while the application reads it, so verifying the Digest header needs no second pass
+    def __init__(self, stream, max_size: int = None):
+        self.stream = stream
+        self.max_size = max_size
+        self.size = 0
+        self.hasher = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        if self.max_size is None:
+            return self._update(self.stream.read(size))
+        if size is not None and size >= 0:
+            return self._update(self.stream.read(self._bounded(size)))
+        # Without a size (e.g. a chunked body) the rest is read in chunks, so an oversized body is refused as soon
+        # as it crosses the limit rather than after it was buffered
+        chunks = []
+        while True:
+            chunk = self._update(self.stream.read(self._bounded(READ_CHUNK_SIZE)))
+            if len(chunk) == 0:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def readline(self, size: int = -1) -> bytes:
+        if self.max_size is None:
+            return self._update(self.stream.readline(size))
+        return self._update(self.stream.readline(self._bounded(size if size is not None and size >= 0 else None)))
+
+    def digest(self) -> str:
+        return base64.b64encode(self.hasher.digest()).decode()
+
+    def _bounded(self, size: int = None) -> int:
+        # One byte over what is left is enough to tell the body is too large
+        remaining = self.max_size - self.size + 1
+        return remaining if size is None else min(size, remaining)
+
+    def _update(self, data: bytes) -> bytes:
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise RequestEntityTooLarge()
+        self.hasher.update(data)
+        return data
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.size} bytes>"
+
+
+class BodyDigestMiddleware:
+    def __init__(self, app: Callable, max_body_size: int = MAX_BODY_SIZE):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    def __call__(self, environ: dict, start_response: Callable):
+        # A declared length over the limit is refused before anything is buffered
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if self.max_body_size is not None and length > self.max_body_size:
+            return RequestEntityTooLarge()(environ, start_response)
+        environ["wsgi.input"] = environ[BODY_DIGEST] = DigestingInput(environ["wsgi.input"], self.max_body_size)
+        return self.app(environ, start_response)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.app}>"